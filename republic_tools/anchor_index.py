@@ -0,0 +1,102 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, defaultdict
+from typing import Dict, Any, Optional, Tuple, List, Sequence
+
+from loguru import logger
+
+
+class AnchorIndex:
+    """Maps line anchors (line indexes), and character offsets within lines, to token ranges.
+
+    Lines and tokens are both kept as sorted character intervals in the ' '-joined text of all lines, so a range
+    of anchors resolves to the tokens that overlap it with two bisects, wherever the line and token boundaries are.
+    """
+
+    def __init__(self, line_starts: Sequence[int], line_ends: Sequence[int]):
+        self.line_starts = line_starts
+        self.line_ends = line_ends
+        self.token_starts = array('q')
+        self.token_ends = array('q')
+
+    @classmethod
+    def for_lines(cls, lines: Sequence[str]) -> "AnchorIndex":
+        line_starts = array('q')
+        line_ends = array('q')
+        offset = 0
+        for line in lines:
+            line_starts.append(offset)
+            line_ends.append(offset + len(line))
+            offset += len(line) + 1
+        return cls(line_starts, line_ends)
+
+    def __len__(self):
+        return len(self.line_starts)
+
+    def add_token(self, start_offset: int, end_offset: int):
+        """Add the character interval of the next token; tokens are added in text order."""
+        self.token_starts.append(start_offset)
+        self.token_ends.append(end_offset)
+
+    def token_range(self, begin_offset: int, end_offset: int) -> Tuple[int, int]:
+        """The (start, end) token indexes of the tokens that overlap the [begin_offset, end_offset) interval.
+
+        When no token overlaps it, start == end is the index of the first token after the interval.
+        """
+        start = bisect_right(self.token_ends, begin_offset)
+        end = bisect_left(self.token_starts, end_offset)
+        return start, max(start, end)
+
+    def char_range(self, begin_anchor: int, end_anchor: int, begin_char_offset: int = None,
+                   end_char_offset: int = None) -> Optional[Tuple[int, int]]:
+        """The [begin, end) character interval of the anchors, or None when they are not lines of the text.
+
+        The char offsets are relative to the start of the begin and end line; end_char_offset, like end_anchor,
+        is inclusive.
+        """
+        if not 0 <= begin_anchor <= end_anchor < len(self.line_starts):
+            return None
+        begin = self.line_starts[begin_anchor]
+        if begin_char_offset is not None:
+            begin += begin_char_offset
+        if end_char_offset is not None:
+            end = self.line_starts[end_anchor] + end_char_offset + 1
+        else:
+            end = self.line_ends[end_anchor]
+        return (begin, end) if begin <= end else None
+
+    def resolve(self, annotation: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        """The (start, end) token indexes of the annotation, or None when its anchors can not be resolved."""
+        char_range = self.char_range(annotation["begin_anchor"], annotation["end_anchor"],
+                                     annotation.get("begin_char_offset"), annotation.get("end_char_offset"))
+        return self.token_range(*char_range) if char_range else None
+
+
+class ResolutionReport:
+    """Counts the annotations per span tag that did not resolve, or resolved to no tokens, and logs a summary."""
+
+    def __init__(self, max_examples: int = 5):
+        self.max_examples = max_examples
+        self.resolved = Counter()
+        self.empty = Counter()
+        self.failed = Counter()
+        self.examples: Dict[str, List[str]] = defaultdict(list)
+
+    def add(self, span_tag: str, annotation: Dict[str, Any], token_range: Optional[Tuple[int, int]]):
+        if token_range is None:
+            self.failed[span_tag] += 1
+            if len(self.examples[span_tag]) < self.max_examples:
+                self.examples[span_tag].append(
+                    f"{annotation['id']} ({annotation['begin_anchor']}-{annotation['end_anchor']})")
+        else:
+            self.resolved[span_tag] += 1
+            if token_range[0] == token_range[1]:
+                self.empty[span_tag] += 1
+
+    def log(self):
+        for span_tag in dict.fromkeys([*self.resolved, *self.failed]):
+            if self.empty[span_tag]:
+                logger.info(f"{self.empty[span_tag]:,} {span_tag} spans have no tokens")
+            if self.failed[span_tag]:
+                logger.warning(f"{self.failed[span_tag]:,} annotations not resolved to tokens, no {span_tag} span"
+                               f" added, e.g. {', '.join(self.examples[span_tag])}")
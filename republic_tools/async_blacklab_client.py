@@ -0,0 +1,96 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from republic_tools.blacklab_client import BlackLabClient
+
+
+class AsyncBlackLabClient:
+    """Asyncio front for BlackLabClient.
+
+    Requests are run on a bounded worker pool that shares one pooled http session,
+    so at most `max_concurrency` requests are in flight at any time.
+    """
+
+    def __init__(self, base_url: str, timeout: int = None, verbose: bool = False, outputformat: str = "json",
+                 max_concurrency: int = 10, **pool_args):
+        pool_args.setdefault('pool_maxsize', max_concurrency)
+        self.client = BlackLabClient(base_url, timeout=timeout, verbose=verbose, outputformat=outputformat,
+                                     **pool_args)
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='blacklab')
+
+    def __str__(self):
+        return f'AsyncBlackLabClient({self.client.base_url})'
+
+    def __repr__(self):
+        return self.__str__()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Wait for running requests, then close the worker pool and the pooled connections."""
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.client.close()
+
+    async def get_server_info(self):
+        return await self.__run(self.client.get_server_info)
+
+    async def get_corpus_information(self, corpus_name: str):
+        return await self.__run(self.client.get_corpus_information, corpus_name)
+
+    async def get_corpus_status(self, corpus_name: str):
+        return await self.__run(self.client.get_corpus_status, corpus_name)
+
+    async def get_corpus_field_information(self, corpus_name: str, field_name: str):
+        return await self.__run(self.client.get_corpus_field_information, corpus_name, field_name)
+
+    async def get_corpus_hits(self, corpus_name: str, patt=None, first: int = None, number: int = None, sort: str = None,
+                              group: str = None, wordsaroundhit: int = None, waitfortotal: bool = None):
+        return await self.__run(self.client.get_corpus_hits, corpus_name, patt=patt, first=first, number=number,
+                                sort=sort, group=group, wordsaroundhit=wordsaroundhit, waitfortotal=waitfortotal)
+
+    async def get_corpus_hits_batch(self, corpus_name: str, patterns: List[str]) -> List[dict]:
+        """Run all patterns concurrently (bounded by max_concurrency), results are in pattern order."""
+        return await asyncio.gather(*[self.get_corpus_hits(corpus_name, patt=patt) for patt in patterns])
+
+    async def get_corpus_docs(self, corpus_name: str, filter: str = None, first: int = None, number: int = None,
+                              sort: str = None):
+        return await self.__run(self.client.get_corpus_docs, corpus_name, filter=filter, first=first, number=number,
+                                sort=sort)
+
+    async def get_corpus_document_metadata(self, corpus_name: str, document_pid: str):
+        return await self.__run(self.client.get_corpus_document_metadata, corpus_name, document_pid)
+
+    async def get_corpus_document_contents(self, corpus_name: str, document_pid: str):
+        return await self.__run(self.client.get_corpus_document_contents, corpus_name, document_pid)
+
+    async def get_corpus_document_snippet(self, corpus_name: str, document_pid: str):
+        return await self.__run(self.client.get_corpus_document_snippet, corpus_name, document_pid)
+
+    async def get_corpus_term_frequency(self, corpus_name: str, annotation: str = 'word'):
+        return await self.__run(self.client.get_corpus_term_frequency, corpus_name, annotation=annotation)
+
+    async def get_corpus_autocomplete(self, corpus_name: str):
+        return await self.__run(self.client.get_corpus_autocomplete, corpus_name)
+
+    async def get_corpus_sharing(self, corpus_name: str):
+        return await self.__run(self.client.get_corpus_sharing, corpus_name)
+
+    async def get_input_formats(self):
+        return await self.__run(self.client.get_input_formats)
+
+    async def get_input_format_configuration(self, format_name: str):
+        return await self.__run(self.client.get_input_format_configuration, format_name)
+
+    async def get_cache_info(self):
+        return await self.__run(self.client.get_cache_info)
+
+    async def __run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
@@ -0,0 +1,58 @@
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union, Iterable
+
+from republic_tools.blacklab_client import BlackLabClient
+
+LabeledPattern = Tuple[str, Dict[str, str]]
+
+
+def pattern_grid(template: str, **axes: Iterable[str]) -> List[LabeledPattern]:
+    """Expand a CQL template over every combination of the axis values.
+
+    >>> pattern_grid('[pos="{pos}"] within <resolution proposition_type="{ptype}"/>', pos=["noun"], ptype=["advies"])
+    [('[pos="noun"] within <resolution proposition_type="advies"/>', {'pos': 'noun', 'ptype': 'advies'})]
+    """
+    names = list(axes.keys())
+    grid = []
+    for values in itertools.product(*axes.values()):
+        labels = dict(zip(names, values))
+        grid.append((template.format(**labels), labels))
+    return grid
+
+
+def run_hits_batch(client: BlackLabClient, corpus_name: str, patterns: List[Union[str, LabeledPattern]],
+                   group: str = None, sort: str = None, max_groups: int = None, max_workers: int = 8,
+                   group_page_size: int = 1000) -> List[dict]:
+    """Run a batch of CQL patterns concurrently, returning counts only, as one row per pattern (or per group).
+
+    No hits or context windows are requested: without group every row holds the total number of hits and docs,
+    with group (e.g. "hit:lemma") there is a row with the size of every group, up to max_groups; the groups are
+    paged through group_page_size at a time.
+    Patterns can be plain strings, or (pattern, labels) tuples as produced by pattern_grid;
+    the labels are added as columns to the rows of that pattern.
+    """
+    client.check_json_results("run_hits_batch")
+    labeled_patterns = [(p, {}) if isinstance(p, str) else p for p in patterns]
+
+    def count(labeled_pattern: LabeledPattern) -> List[dict]:
+        patt, labels = labeled_pattern
+        row = {"patt": patt, **labels}
+        if group:
+            rows = []
+            while max_groups is None or len(rows) < max_groups:
+                number = group_page_size if max_groups is None else min(group_page_size, max_groups - len(rows))
+                result = client.get_corpus_hits(corpus_name, patt=patt, group=group, sort=sort, first=len(rows),
+                                                number=number, wordsaroundhit=0, waitfortotal=True)
+                groups = result["hitGroups"]
+                rows.extend({**row, "group": g["identityDisplay"], "size": g["size"]} for g in groups)
+                if not groups or not result["summary"].get("windowHasNext", len(groups) == number):
+                    break
+            return rows
+        else:
+            result = client.get_corpus_hits(corpus_name, patt=patt, number=0, wordsaroundhit=0, waitfortotal=True)
+            summary = result["summary"]
+            return [{**row, "hits": summary["numberOfHits"], "docs": summary["numberOfDocs"]}]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [row for rows in executor.map(count, labeled_patterns) for row in rows]
@@ -1,19 +1,64 @@
+import contextlib
+import functools
 import http
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+from typing import Union, Iterator, Optional, Callable
 
 import requests
-from icecream import ic
 from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 import republic_tools
+from republic_tools.exceptions import BlackLabConnectionError, BlackLabHTTPError, BlackLabTransientError
+from republic_tools.json_stream import iter_array_items, iter_byte_chunks_as_text
+from republic_tools.request_metrics import RequestMetrics
+from republic_tools.resilience import RetryPolicy, TokenBucket
+from republic_tools.response_cache import MemoryCache, DiskCache, cache_key
+
+
+DECODERS = ("json", "fast", "raw")
 
 
 class BlackLabClient:
-    def __init__(self, base_url: str, timeout: int = None, verbose: bool = False, outputformat: str = "json"):
+    def __init__(self, base_url: str, timeout: int = None, verbose: bool = False, outputformat: str = "json",
+                 pool_connections: int = 10, pool_maxsize: int = 10, pool_block: bool = False,
+                 keep_alive: bool = True, max_retries: Union[int, Retry] = 0,
+                 cache: Union[MemoryCache, DiskCache] = None,
+                 metrics_hook: Callable[[RequestMetrics], None] = None, decoder: str = "json",
+                 retry_policy: RetryPolicy = None, rate_limiter: TokenBucket = None, max_in_flight: int = None):
+        """
+        decoder: how response bodies are returned: "json" (the standard library parser), "fast" (orjson when
+        installed, the standard library parser otherwise) or "raw" (the undecoded body bytes).
+        xml responses are always returned as text.
+        retry_policy: when given, transient errors (busy server, rate limiting, connection errors) are retried
+        with exponential backoff.
+        rate_limiter: when given, every request (including retries) first takes a token from it;
+        it can be shared between clients.
+        max_in_flight: when given, the maximum number of concurrent requests of this client.
+        """
+        if decoder not in DECODERS:
+            raise ValueError(f'unknown decoder "{decoder}", expected one of {", ".join(DECODERS)}')
         self.base_url = base_url.strip('/')
         self.timeout = timeout
         self.verbose = verbose
         self.outputformat = outputformat
+        self.cache = cache
+        self.metrics_hook = metrics_hook
+        self.decoder = decoder
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self.in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else contextlib.nullcontext()
+        self.session = self.__create_session(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                             pool_block=pool_block, keep_alive=keep_alive, max_retries=max_retries)
 
     def __str__(self):
         return f'BlackLabClient({self.base_url})'
@@ -21,114 +66,301 @@ class BlackLabClient:
     def __repr__(self):
         return self.__str__()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Close the pooled connections of this client."""
+        self.session.close()
+
+    def check_json_results(self, operation: str):
+        """Raise a ValueError if the results of this client are not decoded json, which operation needs to read."""
+        if self.decoder == "raw" or self.outputformat != "json":
+            raise ValueError(f'{operation} needs decoded json results, but this client has decoder="{self.decoder}"'
+                             f' and outputformat="{self.outputformat}"')
+
     def get_server_info(self):
         url = f'{self.base_url}/'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        # not cached: it holds the status of every corpus, which no single index version check covers
+        response = self.__get(url=url, endpoint='server_info')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
 
     def get_corpus_information(self, corpus_name: str):
         url = f'{self.base_url}/{corpus_name}'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        return self.__cached_get('corpus_information', corpus_name, url=url)
 
     def get_corpus_status(self, corpus_name: str):
         url = f'{self.base_url}/{corpus_name}/status'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        response = self.__get(url=url, endpoint='corpus_status')
+        status = self.__handle_response(response, {HTTPStatus.OK: self.__decode})
+        if self.cache is not None and isinstance(status, dict) and "timeModified" in status:
+            self.cache.check_index_version(corpus_name, status["timeModified"])
+        return status
 
     def get_corpus_field_information(self, corpus_name: str, field_name: str):
         url = f'{self.base_url}/{corpus_name}/fields/{field_name}'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        return self.__cached_get('corpus_field_information', corpus_name, url=url)
 
-    def get_corpus_hits(self, corpus_name: str, patt=None):
+    def get_corpus_hits(self, corpus_name: str, patt=None, first: int = None, number: int = None, sort: str = None,
+                        group: str = None, wordsaroundhit: int = None, waitfortotal: bool = None):
         url = f'{self.base_url}/{corpus_name}/hits'
         params = {}
         if patt:
             params["patt"] = patt
-        response = self.__get(url=url, params=params)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        if first is not None:
+            params["first"] = first
+        if number is not None:
+            params["number"] = number
+        if sort:
+            params["sort"] = sort
+        if group:
+            params["group"] = group
+        if wordsaroundhit is not None:
+            params["wordsaroundhit"] = wordsaroundhit
+        if waitfortotal is not None:
+            params["waitfortotal"] = str(waitfortotal).lower()
+        response = self.__get(url=url, params=params, endpoint='corpus_hits')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
+
+    def iter_hits(self, corpus_name: str, patt: str, page_size: int = 100, prefetch: bool = False) -> Iterator[dict]:
+        """Yield the hits for patt one at a time, fetching pages of page_size hits on demand.
 
-    def get_corpus_docs(self, corpus_name: str):
+        With prefetch, the next page is requested in the background while the current page is consumed, so up to
+        one page after the point where the caller stops iterating may be fetched; without prefetch, such pages are
+        never requested.
+        """
+        self.check_json_results("iter_hits")
+        fetch_page = functools.partial(self.get_corpus_hits, corpus_name, patt)
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            first = 0
+            next_page = None
+            while True:
+                page = next_page.result() if next_page else fetch_page(first=first, number=page_size)
+                next_page = None
+                hits = page["hits"]
+                first += len(hits)
+                has_next = bool(hits) and page["summary"].get("windowHasNext", len(hits) == page_size)
+                if has_next and executor:
+                    next_page = executor.submit(fetch_page, first=first, number=page_size)
+                yield from hits
+                if not has_next:
+                    break
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_corpus_docs(self, corpus_name: str, filter: str = None, first: int = None, number: int = None,
+                        sort: str = None):
         url = f'{self.base_url}/{corpus_name}/docs'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        params = {}
+        if filter:
+            params["filter"] = filter
+        if first is not None:
+            params["first"] = first
+        if number is not None:
+            params["number"] = number
+        if sort:
+            params["sort"] = sort
+        response = self.__get(url=url, params=params, endpoint='corpus_docs')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
+
+    def iter_corpus_docs(self, corpus_name: str, filter: str = None, page_size: int = 100) -> Iterator[dict]:
+        """Yield all (matching) documents of the corpus, as {"docPid", "docInfo"} dicts, fetching pages on demand."""
+        self.check_json_results("iter_corpus_docs")
+        first = 0
+        while True:
+            page = self.get_corpus_docs(corpus_name, filter=filter, first=first, number=page_size)
+            docs = page["docs"]
+            first += len(docs)
+            yield from docs
+            if not docs or not page["summary"].get("windowHasNext", len(docs) == page_size):
+                break
 
     def get_corpus_document_metadata(self, corpus_name: str, document_pid: str):
         url = f'{self.base_url}/{corpus_name}/docs/{document_pid}'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        response = self.__get(url=url, endpoint='corpus_document_metadata')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
 
     def get_corpus_document_contents(self, corpus_name: str, document_pid: str):
         url = f'{self.base_url}/{corpus_name}/docs/{document_pid}/contents'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        response = self.__get(url=url, endpoint='corpus_document_contents')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
+
+    def iter_corpus_document_contents(self, corpus_name: str, document_pid: str,
+                                      chunk_size: int = 1 << 16) -> Iterator[bytes]:
+        """Yield the document contents as raw byte chunks, without holding the whole document in memory."""
+        url = f'{self.base_url}/{corpus_name}/docs/{document_pid}/contents'
+        with self.__get_stream(url=url, endpoint='corpus_document_contents') as response:
+            yield from response.iter_content(chunk_size=chunk_size)
+
+    def iter_corpus_hits_stream(self, corpus_name: str, patt: str, first: int = None, number: int = None,
+                                chunk_size: int = 1 << 16) -> Iterator[dict]:
+        """Yield the hits of one (possibly very large) hits window while the response is still being read."""
+        if self.outputformat != "json":
+            raise ValueError(f'iter_corpus_hits_stream needs json results, but this client has'
+                             f' outputformat="{self.outputformat}"')
+        url = f'{self.base_url}/{corpus_name}/hits'
+        params = {"patt": patt}
+        if first is not None:
+            params["first"] = first
+        if number is not None:
+            params["number"] = number
+        with self.__get_stream(url=url, params=params, endpoint='corpus_hits') as response:
+            chunks = iter_byte_chunks_as_text(response.iter_content(chunk_size=chunk_size),
+                                              response.encoding or 'utf-8')
+            yield from iter_array_items(chunks, ["hits"])
 
     def get_corpus_document_snippet(self, corpus_name: str, document_pid: str):
         url = f'{self.base_url}/{corpus_name}/docs/{document_pid}/snippet'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        response = self.__get(url=url, endpoint='corpus_document_snippet')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
 
     def get_corpus_term_frequency(self, corpus_name: str, annotation: str = 'word'):
         url = f'{self.base_url}/{corpus_name}/termfreq'
         params = {"annotation": annotation}
-        response = self.__get(url=url, params=params)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        return self.__cached_get('corpus_term_frequency', corpus_name, url=url, params=params)
 
     def get_corpus_autocomplete(self, corpus_name: str):
         url = f'{self.base_url}/{corpus_name}/autocomplete'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        response = self.__get(url=url, endpoint='corpus_autocomplete')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
 
     def get_corpus_sharing(self, corpus_name: str):
         url = f'{self.base_url}/{corpus_name}/sharing'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        response = self.__get(url=url, endpoint='corpus_sharing')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
 
     def get_input_formats(self):
         url = f'{self.base_url}/input-formats'
-        response = self.__get(url=url)
-        
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        return self.__cached_get('input_formats', None, url=url)
 
     def get_input_format_configuration(self, format_name: str):
         url = f'{self.base_url}/input-formats/{format_name}'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        return self.__cached_get('input_format_configuration', None, url=url)
 
     def get_cache_info(self):
         url = f'{self.base_url}/cache-info'
-        response = self.__get(url=url)
-        return self.__handle_response(response, {HTTPStatus.OK: lambda r: r.json()})
+        response = self.__get(url=url, endpoint='cache_info')
+        return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
 
-    def __get(self, url, params=None, **kwargs):
+    def __cached_get(self, endpoint: str, corpus_name: Optional[str], url: str, params: dict = None):
+        if self.cache is None or self.decoder == "raw" or self.outputformat != "json":
+            response = self.__get(url=url, params=params, endpoint=endpoint)
+            return self.__handle_response(response, {HTTPStatus.OK: self.__decode})
+        key = cache_key(url, params)
+        result = self.cache.get(key)
+        if result is None:
+            response = self.__get(url=url, params=params, endpoint=endpoint)
+            result = self.__handle_response(response, {HTTPStatus.OK: self.__decode})
+            self.cache.put(key, corpus_name, result)
+        return result
+
+    def __get_stream(self, url, params=None, endpoint: str = None, **kwargs) -> Response:
+        args = self.__set_defaults(kwargs)
+        response = self.__timed(endpoint, self.session.get, url, params=params, stream=True, **args)
+        self.__report(response.metrics)
+        if response.status_code != HTTPStatus.OK:
+            error = self.__http_error(response)
+            response.close()
+            raise error
+        return response
+
+    def __decode(self, response: Response):
+        if self.decoder == "raw":
+            return response.content
+        if 'json' not in response.headers.get('Content-Type', 'application/json'):
+            return response.text
+        if self.decoder == "fast" and orjson:
+            return orjson.loads(response.content)
+        return response.json()
+
+    def __report(self, metrics: RequestMetrics):
+        if self.metrics_hook:
+            self.metrics_hook(metrics)
+
+    def __create_session(self, pool_connections: int, pool_maxsize: int, pool_block: bool, keep_alive: bool,
+                         max_retries: Union[int, Retry]) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block,
+                              max_retries=max_retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['User-Agent'] = f'blacklab-python-client/{republic_tools.__version__}'
+        session.headers['Accept'] = 'application/json' if self.outputformat == 'json' else 'application/xml'
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def __get(self, url, params=None, endpoint: str = None, **kwargs):
         args = self.__set_defaults(kwargs)
-        return requests.get(url, params=params, **args)
+        return self.__timed(endpoint, self.session.get, url, params=params, **args)
 
-    def __head(self, url, params=None, **kwargs):
+    def __head(self, url, params=None, endpoint: str = None, **kwargs):
         args = self.__set_defaults(kwargs)
-        return requests.head(url, params=params, **args)
+        return self.__timed(endpoint, self.session.head, url, params=params, **args)
 
-    def __post(self, url, data=None, json=None, **kwargs):
+    def __post(self, url, data=None, json=None, endpoint: str = None, **kwargs):
         args = self.__set_defaults(kwargs)
-        return requests.post(url, data=data, json=json, **args)
+        return self.__timed(endpoint, self.session.post, url, data=data, json=json, **args)
 
-    def __put(self, url, data=None, **kwargs):
+    def __put(self, url, data=None, endpoint: str = None, **kwargs):
         args = self.__set_defaults(kwargs)
-        return requests.put(url, data=data, **args)
+        return self.__timed(endpoint, self.session.put, url, data=data, **args)
 
-    def __delete(self, url, **kwargs):
-        ic(url)
-        ic(kwargs)
+    def __delete(self, url, endpoint: str = None, **kwargs):
         args = self.__set_defaults(kwargs)
-        return requests.delete(url, **args)
+        return self.__timed(endpoint, self.session.delete, url, **args)
+
+    def __timed(self, endpoint: str, send, *args, **kwargs) -> Response:
+        start = time.perf_counter()
+        policy = self.retry_policy
+        attempt = 0
+        while True:
+            attempt += 1
+            retry = policy is not None and attempt < policy.max_attempts
+            try:
+                response = self.__send_limited(send, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (retry and policy.retry_connection_errors):
+                    # there is no response to attach the metrics to, so the failure is reported here
+                    method = send.__name__.upper()
+                    url = requests.Request(method, args[0], params=kwargs.get('params')).prepare().url
+                    self.__report(RequestMetrics(endpoint=endpoint, method=method, url=url, status=None,
+                                                 wall_time=time.perf_counter() - start, time_to_first_byte=0.0,
+                                                 response_bytes=0, attempts=attempt, error=type(e).__name__))
+                    raise BlackLabConnectionError(f'{endpoint}: {e}') from e
+                time.sleep(policy.delay(attempt))
+                continue
+            if (retry and response.status_code != HTTPStatus.OK
+                    and policy.is_transient(response.status_code, blacklab_error_code(response))):
+                delay = policy.delay(attempt, retry_after(response))
+                response.close()
+                time.sleep(delay)
+                continue
+            break
+        if kwargs.get('stream'):
+            response_bytes = int(response.headers.get('Content-Length', 0))
+        else:
+            response_bytes = len(response.content)
+        response.metrics = RequestMetrics(endpoint=endpoint, method=response.request.method,
+                                          url=response.request.url, status=response.status_code,
+                                          wall_time=time.perf_counter() - start,
+                                          time_to_first_byte=response.elapsed.total_seconds(),
+                                          response_bytes=response_bytes, attempts=attempt)
+        return response
+
+    def __send_limited(self, send, *args, **kwargs) -> Response:
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        with self.in_flight:
+            return send(*args, **kwargs)
 
     def __set_defaults(self, args: dict):
         # ic(args)
-        if 'headers' not in args:
-            args['headers'] = {}
-        args['headers']['User-Agent'] = f'blacklab-python-client/{republic_tools.__version__}'
-        args['headers']['Accept'] = 'application/json' if self.outputformat == 'json' else 'application/xml'
         if self.timeout:
             args['timeout'] = self.timeout
         return args
@@ -136,17 +368,47 @@ class BlackLabClient:
     def __handle_response(self, response: Response, result_producers: dict):
         status_code = response.status_code
         status_message = http.client.responses[status_code]
+        metrics = response.metrics
         # ic(response.request.headers)
         if self.verbose:
             print(f'-> {response.request.method} {response.request.url}')
-            print(f'<- {status_code} {status_message}')
+            print(f'<- {status_code} {status_message}'
+                  f' ({metrics.wall_time * 1000:.1f} ms, {metrics.response_bytes:,} bytes)')
         if status_code in result_producers:
             # if (self.raise_exceptions):
-            return result_producers[response.status_code](response)
+            start = time.perf_counter()
+            result = result_producers[response.status_code](response)
+            metrics.decode_time = time.perf_counter() - start
+            metrics.wall_time += metrics.decode_time
+            self.__report(metrics)
+            return result
             # else:
             #     return Success(response, result)
         else:
+            self.__report(metrics)
             # if (self.raise_exceptions):
-            raise Exception(
-                f'{response.request.method} {response.request.url} returned {status_code} {status_message}'
-                + f': "{response.text}"')
+            raise self.__http_error(response)
+
+    def __http_error(self, response: Response) -> BlackLabHTTPError:
+        status_code = response.status_code
+        error_code = blacklab_error_code(response)
+        policy = self.retry_policy or RetryPolicy()
+        error_class = BlackLabTransientError if policy.is_transient(status_code, error_code) else BlackLabHTTPError
+        return error_class(method=response.request.method, url=response.request.url, status_code=status_code,
+                           status_message=http.client.responses[status_code], body=response.text,
+                           error_code=error_code)
+
+
+def blacklab_error_code(response: Response) -> Optional[str]:
+    """The BlackLab error code (like "TOO_MANY_JOBS") in an error response, if any."""
+    try:
+        return response.json()["error"]["code"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def retry_after(response: Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
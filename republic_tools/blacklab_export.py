@@ -0,0 +1,110 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Set, List, Tuple, Dict, Any
+
+from loguru import logger
+
+from republic_tools.blacklab_client import BlackLabClient
+from republic_tools.exceptions import BlackLabError
+
+
+@dataclass
+class ExportStats:
+    exported: int = 0
+    skipped: int = 0
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    bytes_written: int = 0
+    seconds: float = 0.0
+
+    @property
+    def documents_per_second(self) -> float:
+        return self.exported / self.seconds if self.seconds else 0.0
+
+
+def exported_document_pids(path: str) -> Set[str]:
+    """The docPids in an (interrupted) export; a last line that was not completely written is cut off."""
+    pids = set()
+    if not os.path.exists(path):
+        return pids
+    complete_size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                pids.add(json.loads(line)["docPid"])
+            except (ValueError, KeyError):
+                break
+            complete_size += len(line)
+    if complete_size < os.path.getsize(path):
+        logger.warning(f"{path}: cutting off the incomplete record at byte {complete_size:,}")
+        os.truncate(path, complete_size)
+    return pids
+
+
+def export_corpus(client: BlackLabClient, corpus_name: str, path: str, filter: str = None, contents: bool = True,
+                  max_workers: int = 8, page_size: int = 100, resume: bool = True,
+                  flush_every: int = 100) -> ExportStats:
+    """Write every document of the corpus as a {"docPid", "metadata", "contents"} line to a JSONL file.
+
+    The document list is paged through, and the metadata and contents of at most max_workers documents are
+    fetched at the same time; the records are written as they come in, so the file is not in document order.
+    With resume, the documents already in the file are skipped and the new ones are appended, so an
+    interrupted export can be continued. Documents that fail are reported in the stats and not written,
+    so a next run with resume retries them.
+    """
+    client.check_json_results("export_corpus")
+    start = time.perf_counter()
+    stats = ExportStats()
+    done = exported_document_pids(path) if resume else set()
+    if done:
+        logger.info(f"{path}: resuming after {len(done):,} exported documents")
+
+    def fetch(pid: str) -> Dict[str, Any]:
+        record = {"docPid": pid, "metadata": client.get_corpus_document_metadata(corpus_name, pid)}
+        if contents:
+            record["contents"] = client.get_corpus_document_contents(corpus_name, pid)
+        return record
+
+    with open(path, "ab" if resume else "wb") as out, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+
+        def write_completed(return_when):
+            completed, _ = wait(in_flight, return_when=return_when)
+            for future in completed:
+                pid = in_flight.pop(future)
+                try:
+                    line = (json.dumps(future.result(), ensure_ascii=False) + "\n").encode("utf-8")
+                except BlackLabError as e:
+                    logger.warning(f"{corpus_name}/{pid}: {e}")
+                    stats.failed.append((pid, str(e)))
+                    continue
+                out.write(line)
+                stats.exported += 1
+                stats.bytes_written += len(line)
+                if stats.exported % flush_every == 0:
+                    out.flush()
+                    logger.info(f"{corpus_name}: {stats.exported:,} documents exported")
+
+        for doc in client.iter_corpus_docs(corpus_name, filter=filter, page_size=page_size):
+            pid = doc["docPid"]
+            if pid in done:
+                stats.skipped += 1
+                continue
+            done.add(pid)
+            # keep the number of pending documents bounded, so the document list is paged through as needed
+            if len(in_flight) >= 2 * max_workers:
+                write_completed(FIRST_COMPLETED)
+            in_flight[executor.submit(fetch, pid)] = pid
+        while in_flight:
+            write_completed(FIRST_COMPLETED)
+
+    stats.seconds = time.perf_counter() - start
+    logger.info(f"{corpus_name}: {stats.exported:,} documents exported to {path}"
+                f" ({stats.bytes_written / (1024 * 1024):,.1f} MB) in {stats.seconds:.1f}s"
+                f" ({stats.documents_per_second:,.1f} docs/s), {stats.skipped:,} skipped, {len(stats.failed):,} failed")
+    return stats
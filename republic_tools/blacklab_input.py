@@ -0,0 +1,200 @@
+import json
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Iterator, Tuple, Any
+
+from loguru import logger
+
+SpanRow = Tuple[str, int, int, Dict[str, Any]]
+
+
+class SpanTable:
+    """Compact, append-only store of spans: interned tags, and start/end token indexes in integer arrays."""
+
+    def __init__(self):
+        self.tags: List[str] = []
+        self._tag_ids: Dict[str, int] = {}
+        self.tag_ids = array('H')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.parameters: List[Optional[tuple]] = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, tag: str, start_token_index: int, end_token_index: int, parameters: Dict[str, Any] = None):
+        tag_id = self._tag_ids.get(tag)
+        if tag_id is None:
+            tag_id = self._tag_ids[tag] = len(self.tags)
+            self.tags.append(tag)
+        self.tag_ids.append(tag_id)
+        self.starts.append(start_token_index)
+        self.ends.append(end_token_index)
+        self.parameters.append(tuple(parameters.items()) if parameters else None)
+
+    def __iter__(self) -> Iterator[SpanRow]:
+        tags = self.tags
+        for tag_id, start, end, parameters in zip(self.tag_ids, self.starts, self.ends, self.parameters):
+            yield tags[tag_id], start, end, dict(parameters) if parameters else {}
+
+
+class _BufferedDocumentWriter:
+    """Collects tokens in batches and writes each batch as one string; reports the export throughput on finish."""
+
+    def __init__(self, path: str, metadata: Dict[str, str], batch_size: int = 10_000, verbose: bool = True):
+        self.path = path
+        self.metadata = metadata
+        self.batch_size = batch_size
+        self.verbose = verbose
+        self.number_of_tokens = 0
+        self.bytes_written = 0
+        self.export_time = 0.0
+        self._pending: List[Tuple[str, str, str]] = []
+        if verbose:
+            logger.info(f"exporting to {path} ...")
+        self._file = open(path, "wb", buffering=1 << 20)
+        self._write(self._header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_token(self, word: str, lemma: str, pos: str):
+        self._pending.append((word, lemma, pos))
+        if len(self._pending) >= self.batch_size:
+            self._flush_tokens()
+
+    def finish(self, spans: SpanTable):
+        """Write the remaining tokens, the spans and the closing records, and report the throughput."""
+        self._flush_tokens()
+        start = time.perf_counter()
+        self._write(self._spans_and_footer(spans))
+        self._file.flush()
+        self.export_time += time.perf_counter() - start
+        if not self.verbose:
+            return
+        megabytes = self.bytes_written / (1024 * 1024)
+        logger.info(f"exported {self.number_of_tokens:,} tokens and {len(spans):,} spans to {self.path}:"
+                    f" {megabytes:,.1f} MB in {self.export_time:.2f}s"
+                    f" ({megabytes / self.export_time if self.export_time else 0:,.1f} MB/s)")
+
+    def close(self):
+        self._file.close()
+
+    def _flush_tokens(self):
+        if self._pending:
+            start = time.perf_counter()
+            self._write(self._tokens(self._pending))
+            self.number_of_tokens += len(self._pending)
+            self._pending = []
+            self.export_time += time.perf_counter() - start
+
+    def _write(self, text: str):
+        data = text.encode("utf-8")
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def _header(self) -> str:
+        raise NotImplementedError
+
+    def _tokens(self, tokens: List[Tuple[str, str, str]]) -> str:
+        raise NotImplementedError
+
+    def _spans_and_footer(self, spans: SpanTable) -> str:
+        raise NotImplementedError
+
+
+class CifWriter(_BufferedDocumentWriter):
+    """Writes one BlackLab CIF document, with a word, lemma and pos value per token, while the tokens are added."""
+
+    def _header(self) -> str:
+        metadata = "".join(f"  METADATA {k} {v}\n" for k, v in self.metadata.items())
+        return f"DOC_START\n{metadata}  FIELD_START contents\n"
+
+    def _tokens(self, tokens: List[Tuple[str, str, str]]) -> str:
+        text = "".join([f"    ADVANCE 1\n    VAL word {word}\n    VAL lemma {lemma}\n    VAL pos {pos}\n"
+                        for word, lemma, pos in tokens])
+        # there is an ADVANCE between tokens, not before the first one
+        return text[len("    ADVANCE 1\n"):] if self.number_of_tokens == 0 else text
+
+    def _spans_and_footer(self, spans: SpanTable) -> str:
+        return "".join(cif_span(*span) for span in spans) + "  FIELD_END\nDOC_END\n"
+
+
+def cif_span(tag: str, start_token_index: int, end_token_index: int, parameters: Dict[str, Any]) -> str:
+    record = [f"    SPAN {tag} {start_token_index} {end_token_index}"]
+    for k, v in parameters.items():
+        value = cif_value(v)
+        if value != "":
+            record.append(f" {k} {value}")
+    record.append("\n")
+    return "".join(record)
+
+
+def cif_value(value: Any) -> Any:
+    """Values are separated by spaces in CIF, and # starts a comment."""
+    return value.replace(" ", "_").replace("#", "_") if isinstance(value, str) else value
+
+
+def unit_documents(spans: SpanTable, unit_tag: str, number_of_tokens: int) -> List[Tuple[int, int, Dict[str, Any]]]:
+    """Split the tokens into (start, end, parameters) documents, one per span with unit_tag.
+
+    Every document runs up to the start of the next one, so the documents cover all tokens; the tokens before the
+    first unit form a document of their own, with empty parameters.
+    """
+    document_parameters = {}
+    for tag, start, _, parameters in spans:
+        if tag == unit_tag:
+            # of the units that start at the same token, the first one names the document
+            document_parameters.setdefault(start, parameters)
+    document_parameters.setdefault(0, {})
+    starts = sorted(document_parameters)
+    return [(start, end, document_parameters[start]) for start, end in zip(starts, starts[1:] + [number_of_tokens])]
+
+
+def split_spans(spans: SpanTable, document_starts: List[int]) -> List[SpanTable]:
+    """The spans of every document, clipped to the document and with token indexes relative to its start."""
+    document_spans = [SpanTable() for _ in document_starts]
+    ends = document_starts[1:] + [None]
+    for tag, start, end, parameters in spans:
+        first = bisect_right(document_starts, start) - 1
+        last = bisect_left(document_starts, end) - 1 if end > start else first
+        for i in range(max(first, 0), last + 1):
+            offset = document_starts[i]
+            clipped_end = end if ends[i] is None else min(end, ends[i])
+            document_spans[i].add(tag, max(start, offset) - offset, clipped_end - offset, parameters)
+    return document_spans
+
+
+class JsonDocumentWriter(_BufferedDocumentWriter):
+    """Writes the metadata, tokens and spans as one json document while the tokens are added.
+
+    The layout is the same as json.dump(..., indent=4) of a {"metadata", "tokens", "spans"} dict.
+    """
+
+    def _header(self) -> str:
+        return '{\n    "metadata": ' + _indent_tail(json.dumps(self.metadata, indent=4), 4) + ',\n    "tokens": ['
+
+    def _tokens(self, tokens: List[Tuple[str, str, str]]) -> str:
+        dumps = json.dumps
+        text = ",\n".join([f'        {{\n            "word": {dumps(word)},\n            "lemma": {dumps(lemma)},'
+                           f'\n            "pos": {dumps(pos)}\n        }}'
+                           for word, lemma, pos in tokens])
+        return ("\n" if self.number_of_tokens == 0 else ",\n") + text
+
+    def _spans_and_footer(self, spans: SpanTable) -> str:
+        tokens_end = "\n    ]" if self.number_of_tokens else "]"
+        span_objects = ",\n".join(
+            "        " + _indent_tail(json.dumps({"tag": tag, "start_token_index": start, "end_token_index": end,
+                                                  "parameters": parameters}, indent=4), 8)
+            for tag, start, end, parameters in spans)
+        spans_json = f"[\n{span_objects}\n    ]" if span_objects else "[]"
+        return f'{tokens_end},\n    "spans": {spans_json}\n}}'
+
+
+def _indent_tail(text: str, indent: int) -> str:
+    """Indent all lines but the first."""
+    return text.replace("\n", "\n" + " " * indent)
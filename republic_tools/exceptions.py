@@ -0,0 +1,23 @@
+class BlackLabError(Exception):
+    """Base class of the errors raised by the BlackLab clients."""
+
+
+class BlackLabConnectionError(BlackLabError):
+    """The server could not be reached, or did not answer in time, after all retries."""
+
+
+class BlackLabHTTPError(BlackLabError):
+    """The server answered with an unexpected status."""
+
+    def __init__(self, method: str, url: str, status_code: int, status_message: str, body: str,
+                 error_code: str = None):
+        super().__init__(f'{method} {url} returned {status_code} {status_message}: "{body}"')
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.body = body
+        self.error_code = error_code
+
+
+class BlackLabTransientError(BlackLabHTTPError):
+    """The server was busy or rate limiting (e.g. 429, 503, TOO_MANY_JOBS), and still was after all retries."""
@@ -0,0 +1,166 @@
+import codecs
+import json
+import re
+from typing import Iterable, Iterator, Sequence, Union, Any
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRUCTURE_OR_STRING = re.compile(r'["{}\[\]]')
+STRING_END_OR_ESCAPE = re.compile(r'["\\]')
+SCALAR_END = re.compile(r'[,\]} \t\n\r]')
+
+
+class _ChunkReader:
+    def __init__(self, chunks: Iterable[str]):
+        self.chunks = iter(chunks)
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, min_size: int = 1) -> bool:
+        """Append at least min_size new characters to the buffer (dropping the consumed part); False at eof."""
+        if self.eof:
+            return False
+        parts = [self.buffer[self.pos:]]
+        added = 0
+        for chunk in self.chunks:
+            parts.append(chunk)
+            added += len(chunk)
+            if added >= min_size:
+                break
+        else:
+            self.eof = True
+        self.buffer = ''.join(parts)
+        self.pos = 0
+        return added > 0
+
+    def peek(self) -> str:
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"expected one of {chars!r} at {self.pos}, found {c!r}")
+        self.pos += 1
+        return c
+
+    def decode_value(self) -> Any:
+        if self.buffer[self.pos:self.pos + 1] == ' ':
+            self.pos += 1
+        if self.buffer[self.pos:self.pos + 1] not in ('"', '{', '[') and self.peek() not in '{["':
+            # a number or literal is only complete once the character following it has been read
+            while not SCALAR_END.search(self.buffer, self.pos) and self.fill():
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                self.pos = end
+                return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(min_size=max(len(self.buffer) - self.pos, 1))
+
+    def skip_value(self):
+        """Skip the next value without building it; only the current chunk is kept in memory."""
+        c = self.peek()
+        if c not in '{[':
+            self.decode_value()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            pattern = STRING_END_OR_ESCAPE if in_string else STRUCTURE_OR_STRING
+            m = pattern.search(self.buffer, self.pos)
+            if not m or (m.group() == '\\' and m.end() == len(self.buffer)):
+                self.pos = m.start() if m else len(self.buffer)
+                if not self.fill():
+                    raise ValueError("unexpected end of json input")
+                continue
+            c = m.group()
+            self.pos = m.end()
+            if in_string:
+                if c == '\\':
+                    self.pos += 1
+                else:
+                    in_string = False
+            elif c == '"':
+                in_string = True
+            elif c in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def descend(self, step: Union[str, int]):
+        """Move to the start of the value at the given object key or array index."""
+        if isinstance(step, str):
+            self.expect('{')
+            if self.peek() == '}':
+                raise KeyError(step)
+            while True:
+                key = self.decode_value()
+                self.expect(':')
+                if key == step:
+                    return
+                self.skip_value()
+                if self.expect(',}') == '}':
+                    raise KeyError(step)
+        else:
+            self.expect('[')
+            for i in range(step):
+                if self.peek() == ']':
+                    raise IndexError(step)
+                self.skip_value()
+                if self.expect(',]') == ']':
+                    raise IndexError(step)
+            if self.peek() == ']':
+                raise IndexError(step)
+
+    def array_items(self) -> Iterator[Any]:
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.decode_value()
+            # fast path for compact json: the separator directly follows the item
+            if self.buffer.startswith(',', self.pos):
+                self.pos += 1
+            elif self.expect(',]') == ']':
+                return
+
+
+def iter_array_items(chunks: Iterable[str], path: Sequence[Union[str, int]] = ()) -> Iterator[Any]:
+    """Yield the items of the json array at path one by one, while reading the json text in chunks.
+
+    Only the current chunk and the current item are kept in memory; values before the array are skipped
+    without being decoded, and nothing after the array is read.
+
+    >>> list(iter_array_items(['{"summary": {"n": 2}, "hi', 'ts": [{"a": 1}, 2', '3]}'], ["hits"]))
+    [{'a': 1}, 23]
+    >>> list(iter_array_items(['{"_resources": [{"_ordered_segments": ["a", "b"]}]}'],
+    ...                       ["_resources", 0, "_ordered_segments"]))
+    ['a', 'b']
+    """
+    reader = _ChunkReader(chunks)
+    for step in path:
+        reader.descend(step)
+    yield from reader.array_items()
+
+
+def iter_byte_chunks_as_text(chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[str]:
+    return codecs.iterdecode(chunks, encoding)
+
+
+def iter_json_file_array_items(file_path: str, path: Sequence[Union[str, int]] = (),
+                               chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """Yield the items of the json array at path in the given json file, reading it chunk_size characters at a time."""
+    with open(file_path, encoding='utf-8') as f:
+        yield from iter_array_items(iter(lambda: f.read(chunk_size), ''), path)
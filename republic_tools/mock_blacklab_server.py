@@ -0,0 +1,218 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Tuple, List
+from urllib.parse import urlparse, parse_qs
+
+words = "de het een van in is en dat op te zijn met voor Staten Generaal resolutie heeft gelesen requeste".split()
+
+
+class MockBlackLabServer:
+    """In-process stand-in for BlackLab Server, with synthetic responses, for offline benchmarks of the clients.
+
+    Serves server info, corpus info/status/fields, hits (also grouped), docs (paged), document metadata and
+    contents, termfreq, autocomplete, input formats and cache info for any corpus name under /blacklab-server.
+    delay (+ up to jitter) seconds is added to every response; error_rate is the fraction of requests that get
+    a 503 SERVER_BUSY error (with retry_after as Retry-After header, when given). number_of_hits and
+    number_of_docs set the size of the synthetic corpus, document_words the size of a document's contents.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, retry_after: float = None, number_of_hits: int = 10_000,
+                 number_of_docs: int = 500, document_words: int = 1000, seed: int = 1728):
+        self.delay = delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.number_of_hits = number_of_hits
+        self.number_of_docs = number_of_docs
+        self.document_words = document_words
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/blacklab-server"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self) -> "MockBlackLabServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, path: str, params: Dict[str, str]) -> Tuple[int, str, bytes, Dict[str, str]]:
+        """(status, content type, body, extra headers) for a GET of path."""
+        parts = [p for p in path.split("/") if p][1:]  # without blacklab-server
+        endpoint = _endpoint(parts)
+        with self._lock:
+            self.requests[endpoint] += 1
+            failing = self._random.random() < self.error_rate
+            pause = self.delay + (self._random.random() * self.jitter if self.jitter else 0.0)
+        if pause:
+            time.sleep(pause)
+        if failing:
+            headers = {"Retry-After": str(self.retry_after)} if self.retry_after is not None else {}
+            return HTTPStatus.SERVICE_UNAVAILABLE, "application/json", _json(
+                {"error": {"code": "SERVER_BUSY", "message": "The server is under heavy load right now."}}), headers
+        if endpoint == "unknown":
+            return HTTPStatus.NOT_FOUND, "application/json", _json(
+                {"error": {"code": "UNKNOWN_OPERATION", "message": f"Unknown operation {path}"}}), {}
+        if endpoint == "corpus_document_contents":
+            return HTTPStatus.OK, "application/xml", self.document_contents(parts[2]).encode("utf-8"), {}
+        return HTTPStatus.OK, "application/json", _json(getattr(self, endpoint)(parts, params)), {}
+
+    def server_info(self, parts, params) -> Dict[str, Any]:
+        return {"blacklabBuildTime": "2022-01-01 00:00:00", "blacklabVersion": "3.0.0-mock",
+                "indices": {"mock": {"displayName": "mock", "status": "available"}}}
+
+    def corpus_information(self, parts, params) -> Dict[str, Any]:
+        return {"indexName": parts[0], "displayName": parts[0], "status": "available",
+                "tokenCount": self.number_of_docs * self.document_words, "documentCount": self.number_of_docs,
+                "annotatedFields": {"contents": {"annotations": {"word": {}, "lemma": {}, "pos": {}}}}}
+
+    def corpus_status(self, parts, params) -> Dict[str, Any]:
+        return {"indexName": parts[0], "status": "available", "timeModified": "2022-07-18 00:00:00"}
+
+    def corpus_field_information(self, parts, params) -> Dict[str, Any]:
+        return {"indexName": parts[0], "fieldName": parts[2], "isAnnotatedField": True,
+                "annotations": {a: {"displayName": a} for a in ("word", "lemma", "pos")}}
+
+    def corpus_hits(self, parts, params) -> Dict[str, Any]:
+        first = int(params.get("first", 0))
+        number = int(params.get("number", 20))
+        context = int(params.get("wordsaroundhit", 5))
+        summary = {"searchParam": dict(params), "numberOfHits": self.number_of_hits,
+                   "numberOfDocs": self.number_of_docs, "windowFirstResult": first,
+                   "requestedWindowSize": number, "windowHasNext": first + number < self.number_of_hits}
+        if "group" in params:
+            groups = [{"identity": f"cws:word:i:{w}", "identityDisplay": w,
+                       "size": self.number_of_hits // len(words)} for w in words]
+            summary["numberOfGroups"] = len(groups)
+            summary["windowHasNext"] = first + number < len(groups)
+            return {"summary": summary, "hitGroups": groups[first:first + number]}
+        hits = [{"docPid": f"doc-{i % self.number_of_docs}", "start": i, "end": i + 1,
+                 "left": {"word": _words(i, context)}, "match": {"word": _words(i + context, 1)},
+                 "right": {"word": _words(i + context + 1, context)}}
+                for i in range(first, min(first + number, self.number_of_hits))]
+        return {"summary": summary, "hits": hits, "docInfos": {}}
+
+    def corpus_docs(self, parts, params) -> Dict[str, Any]:
+        first = int(params.get("first", 0))
+        number = int(params.get("number", 20))
+        docs = [{"docPid": f"doc-{i}", "docInfo": self.document_info(i)}
+                for i in range(first, min(first + number, self.number_of_docs))]
+        return {"summary": {"numberOfDocs": self.number_of_docs, "windowFirstResult": first,
+                            "requestedWindowSize": number, "windowHasNext": first + number < self.number_of_docs},
+                "docs": docs}
+
+    def corpus_document_metadata(self, parts, params) -> Dict[str, Any]:
+        return {"docPid": parts[2], "docInfo": self.document_info(_document_number(parts[2])),
+                "metadataFieldGroups": []}
+
+    def document_info(self, i: int) -> Dict[str, Any]:
+        return {"title": [f"doc-{i}"], "lengthInTokens": self.document_words}
+
+    def document_contents(self, pid: str) -> str:
+        i = _document_number(pid)
+        return f'<doc pid="{pid}">{" ".join(_words(i, self.document_words))}</doc>'
+
+    def corpus_document_snippet(self, parts, params) -> Dict[str, Any]:
+        i = _document_number(parts[2])
+        return {"left": {"word": _words(i, 5)}, "match": {"word": _words(i + 5, 1)}, "right": {"word": _words(i + 6, 5)}}
+
+    def corpus_term_frequency(self, parts, params) -> Dict[str, Any]:
+        return {"termFreq": {w: (len(words) - i) * 1000 for i, w in enumerate(words)}}
+
+    def corpus_autocomplete(self, parts, params) -> List[str]:
+        return [w for w in words if w.startswith(params.get("term", ""))]
+
+    def corpus_sharing(self, parts, params) -> Dict[str, Any]:
+        return {"users": []}
+
+    def input_formats(self, parts, params) -> Dict[str, Any]:
+        return {"supportedInputFormats": {"cif": {"displayName": "CIF", "isConfigurationBased": True}}}
+
+    def input_format_configuration(self, parts, params) -> Dict[str, Any]:
+        return {"formatName": parts[1], "configFileType": "yaml", "configFile": ""}
+
+    def cache_info(self, parts, params) -> Dict[str, Any]:
+        return {"maxSizeBytes": 1 << 30, "numberOfSearches": 0, "sizeBytes": 0}
+
+
+def _endpoint(parts) -> str:
+    if not parts:
+        return "server_info"
+    if parts[0] == "input-formats":
+        return "input_formats" if len(parts) == 1 else "input_format_configuration"
+    if parts[0] == "cache-info":
+        return "cache_info"
+    if len(parts) == 1:
+        return "corpus_information"
+    if len(parts) == 2:
+        return {"status": "corpus_status", "hits": "corpus_hits", "docs": "corpus_docs",
+                "termfreq": "corpus_term_frequency", "autocomplete": "corpus_autocomplete",
+                "sharing": "corpus_sharing"}.get(parts[1], "unknown")
+    if parts[1] == "fields":
+        return "corpus_field_information"
+    if parts[1] == "docs":
+        if len(parts) == 3:
+            return "corpus_document_metadata"
+        return {"contents": "corpus_document_contents", "snippet": "corpus_document_snippet"}.get(parts[3], "unknown")
+    return "unknown"
+
+
+def _document_number(pid: str) -> int:
+    try:
+        return int(pid.rsplit("-", 1)[-1])
+    except ValueError:
+        return 0
+
+
+def _words(start: int, n: int):
+    return [words[(start + i) % len(words)] for i in range(n)]
+
+
+def _json(value) -> bytes:
+    return json.dumps(value).encode("utf-8")
+
+
+def _handler(server: MockBlackLabServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # the headers and the body are separate writes, which Nagle's algorithm would delay by tens of ms
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            status, content_type, body, headers = server.respond(url.path, params)
+            self.send_response(status)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
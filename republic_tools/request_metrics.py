@@ -0,0 +1,96 @@
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Dict, List, Deque, Callable, Optional
+
+from loguru import logger
+
+
+@dataclass
+class RequestMetrics:
+    """The metrics of one request (with its retries); status is None when no response came, see error."""
+    endpoint: str
+    method: str
+    url: str
+    status: Optional[int]
+    wall_time: float
+    time_to_first_byte: float
+    response_bytes: int
+    decode_time: float = 0.0
+    attempts: int = 1
+    error: Optional[str] = None
+
+    @property
+    def failed(self) -> bool:
+        return self.status is None or self.status >= 400
+
+
+def log_metrics(metrics: RequestMetrics):
+    """Metrics hook that logs every request on debug level."""
+    logger.debug(f"{metrics.endpoint} {metrics.status or metrics.error} wall={metrics.wall_time * 1000:.1f}ms"
+                 f" ttfb={metrics.time_to_first_byte * 1000:.1f}ms decode={metrics.decode_time * 1000:.1f}ms"
+                 f" bytes={metrics.response_bytes:,} {metrics.method} {metrics.url}")
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class MetricsRecorder:
+    """Metrics hook that keeps the last `window` requests per endpoint, for rolling percentile summaries.
+
+    Pass it as `metrics_hook` to BlackLabClient; `chain` is an optional hook to pass every request on to,
+    like log_metrics.
+    """
+
+    def __init__(self, window: int = 1000, chain: Callable[[RequestMetrics], None] = None):
+        self.window = window
+        self.chain = chain
+        self._requests: Dict[str, Deque[RequestMetrics]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def __call__(self, metrics: RequestMetrics):
+        with self._lock:
+            self._requests[metrics.endpoint].append(metrics)
+        if self.chain:
+            self.chain(metrics)
+
+    def summary(self) -> Dict[str, dict]:
+        """Per endpoint: request count, error count, wall time percentiles (ms), ttfb and decode medians (ms), bytes."""
+        with self._lock:
+            requests_per_endpoint = {e: list(r) for e, r in self._requests.items()}
+        summary = {}
+        for endpoint, requests in sorted(requests_per_endpoint.items(), key=lambda i: str(i[0])):
+            wall_times = sorted(r.wall_time * 1000 for r in requests)
+            summary[endpoint] = {
+                "count": len(requests),
+                "errors": sum(1 for r in requests if r.failed),
+                "wall_ms_p50": percentile(wall_times, 50),
+                "wall_ms_p90": percentile(wall_times, 90),
+                "wall_ms_p99": percentile(wall_times, 99),
+                "wall_ms_max": wall_times[-1],
+                "ttfb_ms_p50": percentile(sorted(r.time_to_first_byte * 1000 for r in requests), 50),
+                "decode_ms_p50": percentile(sorted(r.decode_time * 1000 for r in requests), 50),
+                "bytes_mean": sum(r.response_bytes for r in requests) / len(requests),
+            }
+        return summary
+
+    def slowest(self, n: int = 10) -> List[RequestMetrics]:
+        """The n slowest requests in the current windows, e.g. to find slow CQL patterns."""
+        with self._lock:
+            requests = [r for rs in self._requests.values() for r in rs]
+        return sorted(requests, key=lambda r: r.wall_time, reverse=True)[:n]
+
+    def dump(self):
+        """Log the summary per endpoint."""
+        for endpoint, s in self.summary().items():
+            logger.info(f"{endpoint}: n={s['count']} errors={s['errors']}"
+                        f" p50={s['wall_ms_p50']:.1f}ms p90={s['wall_ms_p90']:.1f}ms p99={s['wall_ms_p99']:.1f}ms"
+                        f" max={s['wall_ms_max']:.1f}ms ttfb_p50={s['ttfb_ms_p50']:.1f}ms"
+                        f" decode_p50={s['decode_ms_p50']:.1f}ms bytes_mean={s['bytes_mean']:,.0f}")
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
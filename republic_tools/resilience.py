@@ -0,0 +1,55 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import FrozenSet, Optional
+
+TRANSIENT_STATUSES = frozenset({429, 502, 503, 504})
+TRANSIENT_ERROR_CODES = frozenset({"SERVER_BUSY", "TOO_MANY_JOBS"})
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter for transient statuses, BlackLab busy errors and connection errors."""
+    max_attempts: int = 5
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    jitter: bool = True
+    retry_statuses: FrozenSet[int] = TRANSIENT_STATUSES
+    retry_error_codes: FrozenSet[str] = TRANSIENT_ERROR_CODES
+    retry_connection_errors: bool = True
+    respect_retry_after: bool = True
+
+    def is_transient(self, status_code: int, error_code: Optional[str]) -> bool:
+        return status_code in self.retry_statuses or (error_code is not None and error_code in self.retry_error_codes)
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before the next attempt, after the given (1-based) failed attempt."""
+        if retry_after is not None and self.respect_retry_after:
+            return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter: on average `rate` acquisitions per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Block until the tokens are available, then take them."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,162 @@
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional, Dict
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def cache_key(url: str, params: Optional[dict] = None) -> str:
+    return json.dumps([url, params or {}], sort_keys=True, default=str)
+
+
+class MemoryCache:
+    """In-memory LRU cache for BlackLab responses, with an optional time-to-live (in seconds) per entry.
+
+    The responses are kept pickled, so like with DiskCache, every get returns a fresh copy that the caller can
+    change without changing the cached response.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._index_versions: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            corpus_name, expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+        return pickle.loads(value)
+
+    def put(self, key: str, corpus_name: Optional[str], value: Any):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = (corpus_name, expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, corpus_name: str = None):
+        """Drop all entries, or only those of the given corpus."""
+        with self._lock:
+            if corpus_name is None:
+                keys = list(self._entries)
+            else:
+                keys = [k for k, (c, _, _) in self._entries.items() if c == corpus_name]
+            for k in keys:
+                del self._entries[k]
+            self.stats.invalidations += len(keys)
+
+    def check_index_version(self, corpus_name: str, version: Any) -> bool:
+        """Record the index version of corpus_name; drop its entries when it changed. Returns True if it changed."""
+        with self._lock:
+            previous = self._index_versions.get(corpus_name)
+            self._index_versions[corpus_name] = version
+        changed = previous is not None and previous != version
+        if changed:
+            self.invalidate(corpus_name)
+        return changed
+
+    def close(self):
+        pass
+
+
+class DiskCache:
+    """Persistent cache for BlackLab responses in an sqlite database, which survives process restarts."""
+
+    def __init__(self, path: str, ttl: float = None):
+        self.path = path
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses"
+                             " (key TEXT PRIMARY KEY, corpus TEXT, expires REAL, value TEXT)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_corpus ON responses (corpus)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS index_versions (corpus TEXT PRIMARY KEY, version TEXT)")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute("SELECT expires, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            expires, value = row
+            if expires is not None and expires < time.time():
+                with self._db:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+        return json.loads(value)
+
+    def put(self, key: str, corpus_name: Optional[str], value: Any):
+        expires = time.time() + self.ttl if self.ttl else None
+        serialized = json.dumps(value)
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                             (key, corpus_name, expires, serialized))
+
+    def invalidate(self, corpus_name: str = None):
+        """Drop all entries, or only those of the given corpus."""
+        with self._lock, self._db:
+            if corpus_name is None:
+                cursor = self._db.execute("DELETE FROM responses")
+            else:
+                cursor = self._db.execute("DELETE FROM responses WHERE corpus = ?", (corpus_name,))
+            self.stats.invalidations += cursor.rowcount
+
+    def check_index_version(self, corpus_name: str, version: Any) -> bool:
+        """Record the index version of corpus_name; drop its entries when it changed. Returns True if it changed."""
+        version = json.dumps(version)
+        with self._lock, self._db:
+            row = self._db.execute("SELECT version FROM index_versions WHERE corpus = ?", (corpus_name,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO index_versions VALUES (?, ?)", (corpus_name, version))
+        changed = row is not None and row[0] != version
+        if changed:
+            self.invalidate(corpus_name)
+        return changed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,67 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Sequence, Optional, Iterator, List
+
+
+class SpanIndex:
+    """Finds spans by id, and the spans that overlap a token range, with bisects instead of a scan of all spans.
+
+    The spans are ordered by tag and start, and per tag max_ends holds the largest end up to each span, so the
+    spans of a tag that can overlap a range are the run from the first one whose max end reaches the range start
+    to the last one that starts at or before the range end. The ids are kept sorted, with the index of their span.
+    """
+
+    def __init__(self, starts: Sequence[int], ends: Sequence[int], order: Sequence[int], sorted_starts: Sequence[int],
+                 max_ends: Sequence[int], tag_bounds: Sequence[int], ids: Sequence[str], id_spans: Sequence[int]):
+        self.starts = starts
+        self.ends = ends
+        self.order = order
+        self.sorted_starts = sorted_starts
+        self.max_ends = max_ends
+        self.tag_bounds = tag_bounds
+        self.ids = ids
+        self.id_spans = id_spans
+
+    @classmethod
+    def build(cls, tag_ids: Sequence[int], starts: Sequence[int], ends: Sequence[int],
+              span_ids: Sequence[Optional[str]]) -> "SpanIndex":
+        order = array('I', sorted(range(len(starts)), key=lambda j: (tag_ids[j], starts[j])))
+        sorted_starts = array('q', (starts[j] for j in order))
+        max_ends = array('q')
+        tag_bounds = array('q', [0])
+        tag_id = max_end = None
+        for position, j in enumerate(order):
+            if tag_ids[j] != tag_id:
+                if tag_id is not None:
+                    tag_bounds.append(position)
+                tag_id = tag_ids[j]
+                max_end = ends[j]
+            else:
+                max_end = max(max_end, ends[j])
+            max_ends.append(max_end)
+        tag_bounds.append(len(order))
+        identified = sorted((span_id, j) for j, span_id in enumerate(span_ids) if span_id is not None)
+        return cls(starts, ends, order, sorted_starts, max_ends, tag_bounds,
+                   [span_id for span_id, _ in identified], array('I', (j for _, j in identified)))
+
+    def find(self, span_id: str) -> Optional[int]:
+        """The index of the (first) span with this id, or None."""
+        i = bisect_left(self.ids, span_id)
+        if i < len(self.ids) and self.ids[i] == span_id:
+            return self.id_spans[i]
+        return None
+
+    def overlapping_by_tag(self, start: int, end: int) -> List[Iterator[int]]:
+        """Per tag, an iterator over the indexes of its spans that overlap the token range [start, end) or are
+        empty spans in it, in order of start; the spans are only read while the iterators are consumed."""
+        return [self._overlapping(self.tag_bounds[t], self.tag_bounds[t + 1], start, end)
+                for t in range(len(self.tag_bounds) - 1)]
+
+    def _overlapping(self, lo: int, hi: int, start: int, end: int) -> Iterator[int]:
+        starts, ends, order = self.starts, self.ends, self.order
+        first = bisect_left(self.max_ends, start, lo, hi)
+        last = bisect_right(self.sorted_starts, end, lo, hi)
+        for position in range(first, last):
+            j = order[position]
+            if (starts[j] < end and ends[j] > start) or (starts[j] == ends[j] and start <= starts[j] <= end):
+                yield j
@@ -0,0 +1,103 @@
+import json
+import random
+from datetime import date, timedelta
+from typing import List, Dict, Any, Tuple
+
+words = ("de het een van in is en dat op te zijn met voor aan by den Staten Generaal Hoog Mogende Heeren resolutie"
+         " heeft gelesen requeste ontfangen missive Provincie Holland Zeeland Utrecht Raad Staat ordre geresolveert"
+         " gedeputeerde Compagnie Oost-Indische brief ende om dezelve gecommitteerden rapport gehoort").split()
+weekdays = ("Lunae", "Martis", "Mercurii", "Jovis", "Veneris", "Sabbathi")
+attendants = ("Van Heeckeren", "Van Wassenaer", "Torck", "Van Welderen", "Lynden", "Van Isselmuden", "Randwyck")
+
+
+def synthetic_stores(number_of_lines: int, seed: int = 1728) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """A text store and annotation store with the layout of a Resolutions year, for testing and benchmarking.
+
+    Sessions of 50-200 lines start with an attendance list and its attendants, followed by resolutions of 5-40
+    lines, which are divided in paragraphs; some resolutions are reviewed. Pages are 60 lines, every line has a
+    line annotation. A few lines are empty, end in a newline, or contain a #.
+    """
+    rng = random.Random(seed)
+    lines = [synthetic_line(rng) for _ in range(number_of_lines)]
+    annotations = [{"id": f"line-{i}", "type": "line", "begin_anchor": i, "end_anchor": i, "metadata": {}}
+                   for i in range(number_of_lines)]
+    session_date = date(1728, 1, 1)
+    session_begin = 0
+    session_number = 0
+    while session_begin < number_of_lines:
+        session_end = min(number_of_lines - 1, session_begin + rng.randint(50, 200))
+        session_id = f"session-{session_date.isoformat()}-num-{session_number}"
+        resolution_ids = []
+        list_end = min(session_end, session_begin + 5)
+        attendance_list = annotation(f"{session_id}-attendance_list", "attendance_list", session_begin, list_end,
+                                     text_page_num=[1], session_id=session_id)
+        attendant_annotations = [
+            annotation(f"{session_id}-attendant-{i}", "attendant", line, line, name=rng.choice(attendants),
+                       delegate_id=rng.randint(1, 10_000))
+            for i, line in enumerate(range(session_begin + 1, list_end + 1))]
+        resolution_annotations = []
+        resolution_begin = list_end + 1
+        while resolution_begin <= session_end:
+            resolution_end = min(session_end, resolution_begin + rng.randint(5, 40))
+            resolution_id = f"{session_id}-resolution-{len(resolution_ids) + 1}"
+            resolution_ids.append(resolution_id)
+            resolution_annotations.append(
+                annotation(resolution_id, "resolution", resolution_begin, resolution_end, text_page_num=[1],
+                           proposition_origin="unknown", proposition_type=rng.choice(["advies", "missive", "requeste"]),
+                           lang="nl"))
+            paragraph_begin = resolution_begin
+            while paragraph_begin <= resolution_end:
+                paragraph_end = min(resolution_end, paragraph_begin + rng.randint(1, 10))
+                resolution_annotations.append(
+                    annotation(f"{resolution_id}-para-{paragraph_begin}", "republic_paragraph", paragraph_begin,
+                               paragraph_end, text_page_num=[1], page_num=[1], iiif_url="https://example.org/iiif",
+                               lang="nl"))
+                paragraph_begin = paragraph_end + 1
+            if rng.random() < 0.3:
+                resolution_annotations.append(
+                    annotation(f"{resolution_id}-reviewed", "reviewed", resolution_begin, resolution_end,
+                               text_page_num=[1], page_num=[1], iiif_url="https://example.org/iiif", reviewed=True))
+            resolution_begin = resolution_end + 1
+        annotations.append(annotation(session_id, "session", session_begin, session_end,
+                                      session_date=session_date.isoformat(),
+                                      session_weekday=weekdays[session_date.weekday() % len(weekdays)],
+                                      resolution_ids=resolution_ids, text_page_num=[1]))
+        annotations.append(attendance_list)
+        annotations.extend(attendant_annotations)
+        annotations.extend(resolution_annotations)
+        session_begin = session_end + 1
+        session_number += 1
+        session_date += timedelta(days=1)
+    for page_begin in range(0, number_of_lines, 60):
+        annotations.append(annotation(f"page-{page_begin // 60}", "page", page_begin,
+                                      min(number_of_lines - 1, page_begin + 59),
+                                      scan_id=f"NL-HaNA_1.01.02_3783_{page_begin // 60:04d}"))
+    text_store = {"_resources": [{"_id": "synthetic", "_ordered_segments": lines}]}
+    return text_store, annotations
+
+
+def synthetic_line(rng: random.Random) -> str:
+    r = rng.random()
+    if r < 0.01:
+        return ""
+    line_words = [rng.choice(words) for _ in range(rng.randint(1, 12))]
+    if rng.random() < 0.2:
+        line_words[-1] += rng.choice([".", ",", ";"])
+    if rng.random() < 0.02:
+        line_words.insert(rng.randrange(len(line_words) + 1), "#")
+    line = " ".join(line_words)
+    return f"{line}\n" if rng.random() < 0.05 else line
+
+
+def annotation(annotation_id: str, annotation_type: str, begin_anchor: int, end_anchor: int,
+               **metadata) -> Dict[str, Any]:
+    return {"id": annotation_id, "type": annotation_type, "begin_anchor": begin_anchor, "end_anchor": end_anchor,
+            "metadata": metadata}
+
+
+def write_synthetic_stores(text_store_path: str, annotation_store_path: str, number_of_lines: int, seed: int = 1728):
+    text_store, annotations = synthetic_stores(number_of_lines, seed)
+    with open(text_store_path, "w") as f:
+        json.dump(text_store, f)
+    with open(annotation_store_path, "w") as f:
+        json.dump(annotations, f)
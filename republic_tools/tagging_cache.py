@@ -0,0 +1,92 @@
+import hashlib
+import json
+import sqlite3
+from typing import Any, Optional, Dict, Iterable, Set
+
+import spacy
+
+from republic_tools.response_cache import CacheStats
+
+
+def pipeline_fingerprint(nlp) -> str:
+    """Identifies what produces the tags: the model name and version, the spaCy version and the active components."""
+    meta = nlp.meta
+    return (f"{meta.get('lang')}_{meta.get('name')}-{meta.get('version')}"
+            f" spacy-{spacy.__version__} {','.join(nlp.pipe_names)}")
+
+
+def chunk_key(fingerprint: str, text: str) -> str:
+    return hashlib.sha256(f"{fingerprint}\n{text}".encode()).hexdigest()
+
+
+class TaggingCache:
+    """Persistent, content-addressed cache of the tagging results per chunk of text, in an sqlite database.
+
+    New entries are kept in memory and written in one short transaction per commit_every entries, and on close,
+    so the write lock is never held while tagging. With the database in WAL mode, builds that run in parallel
+    can share it: readers do not block the writer, and a writer only waits for another one's batch insert.
+    """
+
+    def __init__(self, path: str, commit_every: int = 1000, timeout: float = 60):
+        """timeout: seconds to wait for another build's write lock before giving up."""
+        self.path = path
+        self.commit_every = commit_every
+        self.stats = CacheStats()
+        self._pending: Dict[str, str] = {}
+        # autocommit mode: sqlite3 does not open a transaction of its own, the batch inserts are explicit ones
+        self._db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, value TEXT)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def existing_keys(self, keys: Iterable[str], batch_size: int = 500) -> Set[str]:
+        """Those of the keys that are in the cache, without reading their values; the others count as misses."""
+        keys = list(keys)
+        existing = {key for key in keys if key in self._pending}
+        for i in range(0, len(keys), batch_size):
+            batch = keys[i:i + batch_size]
+            rows = self._db.execute(f"SELECT key FROM chunks WHERE key IN ({','.join('?' * len(batch))})", batch)
+            existing.update(row[0] for row in rows)
+        self.stats.misses += len(set(keys) - existing)
+        return existing
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._pending.get(key)
+        if value is None:
+            row = self._db.execute("SELECT value FROM chunks WHERE key = ?", (key,)).fetchone()
+            value = row[0] if row else None
+        if value is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return json.loads(value)
+
+    def put(self, key: str, value: Any):
+        self._pending[key] = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        if len(self._pending) >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        if not self._pending:
+            return
+        # BEGIN IMMEDIATE takes the write lock up front, so the transaction cannot fail halfway on a busy database
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?)", self._pending.items())
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        self._pending = {}
+
+    def close(self):
+        self.commit()
+        self._db.close()
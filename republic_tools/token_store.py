@@ -0,0 +1,237 @@
+"""Compact, memory-mappable store of the tokens and spans of a BlackLab input document.
+
+Words, lemmas and pos tags are dictionary encoded as integer arrays, spans are parallel tag/start/end integer
+arrays with an index into a table of (json encoded) span parameters, and the arrays of a SpanIndex on the spans
+and their ids. The file is:
+
+    magic (8 bytes) | header length (8 bytes, little endian) | json header | 8-byte aligned sections
+
+where the header holds the metadata, the counts and the offset, length and array typecode of every section.
+"""
+import json
+import mmap
+import sys
+import time
+from array import array
+from typing import Dict, List, Tuple, Iterator, Any, Sequence
+
+from loguru import logger
+
+from republic_tools.blacklab_input import SpanTable, SpanRow
+from republic_tools.span_index import SpanIndex
+
+MAGIC = b"RTTSTOR1"
+
+
+class _Vocabulary:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def id(self, value: str) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+
+class TokenStoreWriter:
+    """Collects the tokens as dictionary encoded arrays, and writes the token store on finish."""
+
+    def __init__(self, path: str, metadata: Dict[str, str]):
+        self.path = path
+        self.metadata = metadata
+        self._vocabularies = {"word": _Vocabulary(), "lemma": _Vocabulary(), "pos": _Vocabulary()}
+        self._ids = {"word": array('I'), "lemma": array('I'), "pos": array('I')}
+        logger.info(f"exporting to {path} ...")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_token(self, word: str, lemma: str, pos: str):
+        self._ids["word"].append(self._vocabularies["word"].id(word))
+        self._ids["lemma"].append(self._vocabularies["lemma"].id(lemma))
+        self._ids["pos"].append(self._vocabularies["pos"].id(pos))
+
+    def finish(self, spans: SpanTable):
+        start = time.perf_counter()
+        parameter_values = [json.dumps(dict(p), ensure_ascii=False).encode() if p else b"" for p in spans.parameters]
+        sections = {}
+        for name, ids in self._ids.items():
+            sections[f"{name}_ids"] = ids
+            sections[f"{name}_offsets"], sections[f"{name}_strings"] = _string_table(
+                [v.encode() for v in self._vocabularies[name].values])
+        sections["span_tag_ids"] = array('I', spans.tag_ids)
+        sections["span_starts"] = spans.starts
+        sections["span_ends"] = spans.ends
+        sections["span_tag_offsets"], sections["span_tag_strings"] = _string_table([t.encode() for t in spans.tags])
+        sections["span_parameter_offsets"], sections["span_parameter_strings"] = _string_table(parameter_values)
+        index = SpanIndex.build(spans.tag_ids, spans.starts, spans.ends,
+                                [dict(p).get("id") if p else None for p in spans.parameters])
+        sections["span_index_order"] = index.order
+        sections["span_index_starts"] = index.sorted_starts
+        sections["span_index_max_ends"] = index.max_ends
+        sections["span_index_tag_bounds"] = index.tag_bounds
+        sections["span_id_offsets"], sections["span_id_strings"] = _string_table([i.encode() for i in index.ids])
+        sections["span_id_spans"] = index.id_spans
+        write_token_store(self.path, self.metadata, len(self._ids["word"]), len(spans), sections)
+        logger.info(f"exported {len(self._ids['word']):,} tokens and {len(spans):,} spans to {self.path}"
+                    f" in {time.perf_counter() - start:.2f}s")
+
+    def close(self):
+        pass
+
+
+def _string_table(values: List[bytes]) -> Tuple[array, bytes]:
+    offsets = array('q', [0])
+    total = 0
+    for v in values:
+        total += len(v)
+        offsets.append(total)
+    return offsets, b"".join(values)
+
+
+def write_token_store(path: str, metadata: Dict[str, str], number_of_tokens: int, number_of_spans: int,
+                      sections: Dict[str, Any]):
+    layout = {}
+    offset = 0
+    for name, data in sections.items():
+        length = len(data) * data.itemsize if isinstance(data, array) else len(data)
+        layout[name] = [offset, length, data.typecode if isinstance(data, array) else "B"]
+        offset += length + (-length % 8)
+    header = json.dumps({"metadata": metadata, "number_of_tokens": number_of_tokens,
+                         "number_of_spans": number_of_spans, "byteorder": sys.byteorder,
+                         "sections": layout}).encode()
+    header += b" " * (-(len(header) + 16) % 8)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, data in sections.items():
+            raw = data.tobytes() if isinstance(data, array) else data
+            f.write(raw)
+            f.write(b"\0" * (-len(raw) % 8))
+
+
+class _DecodedColumn(Sequence[str]):
+    def __init__(self, ids, values: List[str]):
+        self._ids = ids
+        self._values = values
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            values = self._values
+            return [values[value_id] for value_id in self._ids[i]]
+        return self._values[self._ids[i]]
+
+
+class _StringColumn(Sequence[str]):
+    """A string table that decodes its strings on access."""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].decode()
+
+
+class TokenStore:
+    """Read-only view of a token store file; the arrays are memory mapped, not read into memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        self._views: List[memoryview] = []
+        if self._mmap[:8] != MAGIC:
+            raise ValueError(f"{path} is not a token store")
+        header_length = int.from_bytes(self._mmap[8:16], "little")
+        header = json.loads(self._mmap[16:16 + header_length])
+        self._data_offset = 16 + header_length
+        self.metadata: Dict[str, str] = header["metadata"]
+        self.number_of_tokens: int = header["number_of_tokens"]
+        self.number_of_spans: int = header["number_of_spans"]
+        self._native = header["byteorder"] == sys.byteorder
+        self._layout = header["sections"]
+        self.words = _DecodedColumn(self._section("word_ids"), self._strings("word"))
+        self.lemmas = _DecodedColumn(self._section("lemma_ids"), self._strings("lemma"))
+        self.pos = _DecodedColumn(self._section("pos_ids"), self._strings("pos"))
+        self.span_tags: List[str] = self._strings("span_tag")
+        self.span_tag_ids = self._section("span_tag_ids")
+        self.span_starts = self._section("span_starts")
+        self.span_ends = self._section("span_ends")
+        self._parameter_offsets = self._section("span_parameter_offsets")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.number_of_tokens
+
+    def close(self):
+        # the mapping can only be closed when no memoryview on it is left
+        for view in reversed(self._views):
+            view.release()
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+
+    def token(self, i: int) -> Tuple[str, str, str]:
+        return self.words[i], self.lemmas[i], self.pos[i]
+
+    def span_parameters(self, span_index: int) -> Dict[str, Any]:
+        start, end = self._parameter_offsets[span_index], self._parameter_offsets[span_index + 1]
+        if start == end:
+            return {}
+        base = self._data_offset + self._layout["span_parameter_strings"][0]
+        return json.loads(self._mmap[base + start:base + end])
+
+    def span_index(self) -> SpanIndex:
+        base = self._data_offset + self._layout["span_id_strings"][0]
+        ids = _StringColumn(self._section("span_id_offsets"),
+                            self._mmap[base:base + self._layout["span_id_strings"][1]])
+        return SpanIndex(self.span_starts, self.span_ends, self._section("span_index_order"),
+                         self._section("span_index_starts"), self._section("span_index_max_ends"),
+                         self._section("span_index_tag_bounds"), ids, self._section("span_id_spans"))
+
+    def spans(self) -> Iterator[SpanRow]:
+        tags = self.span_tags
+        for j in range(self.number_of_spans):
+            yield tags[self.span_tag_ids[j]], self.span_starts[j], self.span_ends[j], self.span_parameters(j)
+
+    def _section(self, name: str):
+        offset, length, typecode = self._layout[name]
+        start = self._data_offset + offset
+        if self._native:
+            view = self._view[start:start + length]
+            self._views.extend((view, view.cast(typecode)))
+            return self._views[-1]
+        values = array(typecode, self._mmap[start:start + length])
+        values.byteswap()
+        return values
+
+    def _strings(self, name: str) -> List[str]:
+        offsets = self._section(f"{name}_offsets")
+        base = self._data_offset + self._layout[f"{name}_strings"][0]
+        blob = self._mmap[base:base + self._layout[f"{name}_strings"][1]]
+        return [blob[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+
+def is_token_store(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(8) == MAGIC
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+
+import spacy
+from loguru import logger
+from spacy.language import Language
+
+from republic_tools.anchor_index import AnchorIndex
+from republic_tools.blacklab_input import SpanTable, CifWriter, JsonDocumentWriter
+from republic_tools.synthetic_stores import write_synthetic_stores
+from republic_tools.token_store import TokenStoreWriter
+
+stub_model = "stub"
+
+
+def load_create_pos():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rt-create-pos.py")
+    spec = importlib.util.spec_from_file_location("rt_create_pos", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@Language.component("stub_tagger")
+def stub_tagger(doc):
+    for token in doc:
+        token.lemma_ = token.lower_
+        token.pos_ = "SPACE" if token.is_space else "PUNCT" if token.is_punct else "NOUN"
+    return doc
+
+
+def stub_pipeline():
+    """Tokenizer, rule-based sentencizer and a tagger that sets the lowercased word as lemma: fast, and offline."""
+    nlp = spacy.blank("nl")
+    nlp.add_pipe("sentencizer")
+    nlp.add_pipe("stub_tagger")
+    return nlp
+
+
+class TokenCollector:
+    def __init__(self):
+        self.tokens = []
+
+    def add_token(self, word: str, lemma: str, pos: str):
+        self.tokens.append((word, lemma, pos))
+
+
+def proc_status_mb(field: str) -> Optional[float]:
+    """VmRSS or VmHWM (peak RSS) of this process from /proc (Linux only), in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak RSS (VmHWM) of this process to its current RSS (Linux only); returns whether it worked."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageTimer:
+    """Times the stages, and measures their memory use.
+
+    Per stage, rss_start_mb is the RSS when the stage starts and peak_rss_mb the peak RSS during the stage (on
+    Linux, where the peak can be reset; None elsewhere). cumulative_peak_rss_mb is the peak of the process so far,
+    which later stages only repeat if they use less memory.
+    """
+
+    def __init__(self, peak_rss_mb: Callable[[], float]):
+        self.peak_rss_mb = peak_rss_mb
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        # resetting the peak also resets ru_maxrss, so the peak of the process is kept here
+        self.cumulative_peak_rss_mb = peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name: str, unit: str):
+        """Time the stage; set "items" on the yielded dict to report the throughput in units per second."""
+        record = {"unit": unit, "items": None}
+        logger.info(f"{name} ...")
+        rss_start = proc_status_mb("VmRSS")
+        peak_was_reset = reset_peak_rss()
+        start = time.perf_counter()
+        yield record
+        seconds = time.perf_counter() - start
+        record["seconds"] = round(seconds, 4)
+        if record["items"] is not None:
+            record["items_per_second"] = round(record["items"] / seconds) if seconds else None
+        stage_peak = proc_status_mb("VmHWM") if peak_was_reset else None
+        record["rss_start_mb"] = round(rss_start, 1) if rss_start is not None else None
+        record["peak_rss_mb"] = round(stage_peak, 1) if stage_peak is not None else None
+        self.cumulative_peak_rss_mb = max(self.cumulative_peak_rss_mb, stage_peak or 0.0, self.peak_rss_mb())
+        record["cumulative_peak_rss_mb"] = round(self.cumulative_peak_rss_mb, 1)
+        self.stages[name] = record
+        logger.info(f"{name}: {seconds:.3f}s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of rt-create-pos on synthetic stores")
+    parser.add_argument("--lines", type=int, default=20_000, help="number of lines to generate (default: 20000)")
+    parser.add_argument("--seed", type=int, default=1728, help="seed of the synthetic data")
+    parser.add_argument("--model", default=stub_model,
+                        help="the spaCy model to tag with, or 'stub' for a stub tagger (default: stub)")
+    parser.add_argument("--profile", default="full", help="the rt-create-pos pipeline profile for --model")
+    parser.add_argument("--chunk-by", choices=["none", "resolution", "republic_paragraph"], default="none")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--n-process", type=int, default=1)
+    parser.add_argument("--work-dir", help="where to write the stores and the output (default: a temporary directory)")
+    parser.add_argument("--report", help="write the json report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="compare the stage times with this earlier report")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="a stage that takes more than this times the baseline time is a regression"
+                             " (default: 1.2); regressions make the exit code 1")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="stage times are compared as at least this many seconds, so stages that are this fast"
+                             " in both runs are never a regression (default: 0.05)")
+    parser.add_argument("--verbose", action="store_true", help="log the progress of the stages")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="INFO" if args.verbose else "WARNING")
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+        report = benchmark(args, args.work_dir)
+    else:
+        with tempfile.TemporaryDirectory() as work_dir:
+            report = benchmark(args, work_dir)
+    report_json = json.dumps(report, indent=4)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(report_json + "\n")
+    else:
+        print(report_json)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold, args.min_seconds):
+            sys.exit(1)
+
+
+def benchmark(args, work_dir: str) -> Dict[str, Any]:
+    rt = load_create_pos()
+    timer = StageTimer(rt.peak_rss_mb)
+    text_store_path = os.path.join(work_dir, "synthetic-textstore.json")
+    annotation_store_path = os.path.join(work_dir, "synthetic-annotationstore.json")
+    start = time.perf_counter()
+
+    with timer.stage("generate", "lines") as s:
+        write_synthetic_stores(text_store_path, annotation_store_path, args.lines, args.seed)
+        s["items"] = args.lines
+    with timer.stage("load_text", "lines") as s:
+        lines = rt.load_text_lines(text_store_path)
+        s["items"] = len(lines)
+    with timer.stage("load_annotations", "annotations") as s:
+        annotations_by_type, line_ids = rt.load_annotations(annotation_store_path)
+        s["items"] = len(line_ids) + sum(len(a) for a in annotations_by_type.values())
+    selection = [l.replace("\n", " ") for l in lines]
+    with timer.stage("index_line_ending_offset", "lines") as s:
+        line_idx_for_ending_offset = rt.index_line_ending_offset(selection)
+        s["items"] = len(selection)
+    with timer.stage("load_pipeline", "pipelines"):
+        nlp = stub_pipeline() if args.model == stub_model else rt.load_pipeline(args.model, args.profile, [])
+    with timer.stage("tagging", "chars") as s:
+        if args.chunk_by == "none":
+            tagged_sentences = list(rt.calculate_pos(nlp, selection))
+        else:
+            chunk_starts = rt.chunk_start_lines(annotations_by_type[args.chunk_by])
+            tagged_sentences = list(rt.calculate_pos_in_chunks(nlp, selection, chunk_starts,
+                                                               batch_size=args.batch_size, n_process=args.n_process))
+        s["items"] = sum(len(l) + 1 for l in selection)
+    with timer.stage("span_building", "tokens") as s:
+        collector = TokenCollector()
+        spans = SpanTable()
+        anchor_index = AnchorIndex.for_lines(selection)
+        s["items"] = rt.add_tokens(tagged_sentences, [collector], spans, anchor_index, line_idx_for_ending_offset,
+                                   line_ids)
+        rt.add_annotation_spans(spans, annotations_by_type, anchor_index)
+    metadata = {"title": "synthetic", "text_source": text_store_path, "annotation_source": annotation_store_path}
+    exports = [("cif_export", CifWriter, "input.cif"), ("json_export", JsonDocumentWriter, "out.json"),
+               ("token_store_export", TokenStoreWriter, "out.tokens")]
+    output_bytes = {}
+    for stage, writer_class, file_name in exports:
+        path = os.path.join(work_dir, file_name)
+        with timer.stage(stage, "tokens") as s:
+            writer = writer_class(path, metadata)
+            for word, lemma, pos in collector.tokens:
+                writer.add_token(word, lemma, pos)
+            writer.finish(spans)
+            writer.close()
+            s["items"] = len(collector.tokens)
+        output_bytes[file_name] = os.path.getsize(path)
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "spacy": spacy.__version__,
+        "platform": platform.platform(),
+        "parameters": {"lines": args.lines, "seed": args.seed, "model": args.model, "profile": args.profile,
+                       "chunk_by": args.chunk_by, "batch_size": args.batch_size, "n_process": args.n_process},
+        "tokens": len(collector.tokens),
+        "spans": len(spans),
+        "output_bytes": output_bytes,
+        "stages": timer.stages,
+        "total_seconds": round(time.perf_counter() - start, 4),
+        "peak_rss_mb": round(timer.cumulative_peak_rss_mb, 1),
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_seconds: float) -> bool:
+    """Print the time of every stage relative to the baseline; returns True if any stage regressed.
+
+    Times below min_seconds are compared as min_seconds, so timer noise in very fast stages is not a regression.
+    """
+    if report["parameters"] != baseline.get("parameters"):
+        logger.warning(f"the baseline was made with other parameters: {baseline.get('parameters')}")
+    regressed = False
+    print(f"{'stage':<26}{'baseline':>10}{'now':>10}{'ratio':>8}", file=sys.stderr)
+    for stage, record in report["stages"].items():
+        if stage not in baseline["stages"]:
+            continue
+        before = baseline["stages"][stage]["seconds"]
+        ratio = max(record["seconds"], min_seconds) / max(before, min_seconds)
+        mark = ""
+        if ratio > threshold:
+            regressed = True
+            mark = "  slower"
+        print(f"{stage:<26}{before:>10.3f}{record['seconds']:>10.3f}{ratio:>8.2f}{mark}", file=sys.stderr)
+    return regressed
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Callable
+
+from loguru import logger
+
+from republic_tools.blacklab_client import BlackLabClient, DECODERS
+from republic_tools.exceptions import BlackLabError
+from republic_tools.mock_blacklab_server import MockBlackLabServer
+from republic_tools.request_metrics import MetricsRecorder, percentile
+from republic_tools.resilience import RetryPolicy
+from republic_tools.response_cache import MemoryCache
+
+
+def operations(client: BlackLabClient, corpus: str, page_size: int) -> Dict[str, Callable[[random.Random], object]]:
+    return {
+        "hits": lambda rng: client.get_corpus_hits(corpus, patt='[lemma="resolutie"]', first=rng.randrange(50) * page_size,
+                                                   number=page_size),
+        "grouped_hits": lambda rng: client.get_corpus_hits(corpus, patt='[pos="NOUN"]', group="hit:lemma", number=50),
+        "docs": lambda rng: client.get_corpus_docs(corpus, first=rng.randrange(10) * page_size, number=page_size),
+        "contents": lambda rng: client.get_corpus_document_contents(corpus, f"doc-{rng.randrange(100)}"),
+        "termfreq": lambda rng: client.get_corpus_term_frequency(corpus),
+        "status": lambda rng: client.get_corpus_status(corpus),
+    }
+
+
+def parse_mix(mix: str) -> List[str]:
+    """'hits=4,status=1' -> ['hits', 'hits', 'hits', 'hits', 'status']"""
+    weighted = []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weighted.extend([name.strip()] * int(weight or 1))
+    return weighted
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test BlackLabClient against a BlackLab server, by default an"
+                                                 " in-process mock server, and report throughput and latencies")
+    parser.add_argument("--url", help="the BlackLab server to test (default: start a mock server)")
+    parser.add_argument("--corpus", default="mock", help="the corpus to query (default: mock)")
+    parser.add_argument("--workers", type=int, default=8, help="number of concurrent workers (default: 8)")
+    parser.add_argument("--requests", type=int, default=2000, help="total number of calls (default: 2000)")
+    parser.add_argument("--mix", default="hits=4,grouped_hits=1,docs=2,contents=1,termfreq=1,status=1",
+                        help="the operations and their weights (default: %(default)s)")
+    parser.add_argument("--page-size", type=int, default=20, help="number of hits/docs per page (default: 20)")
+    parser.add_argument("--seed", type=int, default=1728)
+    mock = parser.add_argument_group("mock server")
+    mock.add_argument("--delay", type=float, default=0.0, help="seconds the mock server waits before responding")
+    mock.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds more")
+    mock.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 SERVER_BUSY responses")
+    mock.add_argument("--retry-after", type=float, help="Retry-After seconds of the 503 responses")
+    mock.add_argument("--document-words", type=int, default=1000, help="size of the document contents")
+    client = parser.add_argument_group("client")
+    client.add_argument("--pool-maxsize", type=int, help="connections per host (default: --workers)")
+    client.add_argument("--no-keep-alive", action="store_true", help="a new connection for every request")
+    client.add_argument("--cache", choices=["none", "memory"], default="none", help="response cache (default: none)")
+    client.add_argument("--retries", type=int, default=0,
+                        help="attempts per call for transient errors, with backoff (default: 0, no retry policy)")
+    client.add_argument("--backoff-base", type=float, default=0.05, help="backoff base of the retry policy (seconds)")
+    client.add_argument("--decoder", choices=DECODERS, default="json")
+    parser.add_argument("--report", help="write the json report to this file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = None
+    if args.url is None:
+        server = MockBlackLabServer(delay=args.delay, jitter=args.jitter, error_rate=args.error_rate,
+                                    retry_after=args.retry_after, document_words=args.document_words,
+                                    seed=args.seed).start()
+    try:
+        report = run(args, args.url or server.base_url)
+    finally:
+        if server:
+            server.stop()
+    if server:
+        report["server_requests"] = dict(server.requests)
+    log_report(report)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=4)
+        logger.info(f"report written to {args.report}")
+
+
+def run(args, base_url: str) -> dict:
+    recorder = MetricsRecorder(window=args.requests * 10)
+    cache = MemoryCache() if args.cache == "memory" else None
+    retry_policy = RetryPolicy(max_attempts=args.retries, backoff_base=args.backoff_base) if args.retries else None
+    mix = parse_mix(args.mix)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    counter = itertools.count()
+
+    with BlackLabClient(base_url, timeout=60, pool_maxsize=args.pool_maxsize or args.workers,
+                        keep_alive=not args.no_keep_alive, cache=cache, metrics_hook=recorder,
+                        decoder=args.decoder, retry_policy=retry_policy) as client:
+        ops = operations(client, args.corpus, args.page_size)
+        unknown = set(mix) - ops.keys()
+        if unknown:
+            raise SystemExit(f"unknown operations in --mix: {', '.join(sorted(unknown))}")
+
+        def worker(worker_number: int):
+            rng = random.Random(args.seed + worker_number)
+            while next(counter) < args.requests:
+                name = rng.choice(mix)
+                start = time.perf_counter()
+                try:
+                    ops[name](rng)
+                    failed = False
+                except BlackLabError:
+                    failed = True
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies[name].append(elapsed * 1000)
+                    if failed:
+                        errors[name] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            list(executor.map(worker, range(args.workers)))
+        seconds = time.perf_counter() - start
+
+    all_latencies = sorted(l for ls in latencies.values() for l in ls)
+    return {
+        "base_url": base_url,
+        "workers": args.workers,
+        "calls": len(all_latencies),
+        "errors": sum(errors.values()),
+        "seconds": round(seconds, 3),
+        "calls_per_second": round(len(all_latencies) / seconds, 1),
+        "latency_ms": latency_summary(all_latencies),
+        "operations": {name: {"calls": len(ls), "errors": errors[name], "latency_ms": latency_summary(sorted(ls))}
+                       for name, ls in sorted(latencies.items())},
+        "http_requests": recorder.summary(),
+        "cache": cache.stats.__dict__ if cache else None,
+    }
+
+
+def latency_summary(sorted_latencies: List[float]) -> Dict[str, float]:
+    if not sorted_latencies:
+        return {}
+    return {"p50": round(percentile(sorted_latencies, 50), 2), "p90": round(percentile(sorted_latencies, 90), 2),
+            "p99": round(percentile(sorted_latencies, 99), 2), "max": round(sorted_latencies[-1], 2)}
+
+
+def log_report(report: dict):
+    latency = report["latency_ms"]
+    logger.info(f"{report['calls']:,} calls by {report['workers']} workers in {report['seconds']:.2f}s:"
+                f" {report['calls_per_second']:,.1f} calls/s, {report['errors']:,} errors,"
+                f" p50={latency.get('p50')}ms p90={latency.get('p90')}ms p99={latency.get('p99')}ms")
+    for name, op in report["operations"].items():
+        latency = op["latency_ms"]
+        logger.info(f"  {name}: {op['calls']:,} calls, {op['errors']:,} errors,"
+                    f" p50={latency.get('p50')}ms p99={latency.get('p99')}ms")
+    if report["cache"]:
+        logger.info(f"  cache: {report['cache']}")
+
+
+if __name__ == '__main__':
+    main()
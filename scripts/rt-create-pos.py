@@ -1,14 +1,46 @@
 #!/usr/bin/env python3
+import argparse
 import json
-from dataclasses import dataclass, field
-from typing import Dict, List, Any
+import os
+import resource
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Any, Iterator, Set, Iterable, Tuple, Optional
 
 import spacy as spacy
 from loguru import logger
 
+from republic_tools.anchor_index import AnchorIndex, ResolutionReport
+from republic_tools.blacklab_input import SpanTable, CifWriter, JsonDocumentWriter, cif_value, unit_documents, \
+    split_spans
+from republic_tools.json_stream import iter_json_file_array_items
+from republic_tools.tagging_cache import TaggingCache, pipeline_fingerprint, chunk_key
+from republic_tools.token_store import TokenStoreWriter, TokenStore
+
 spacy_core = "nl_core_news_lg"
 text_store_path = 'data/1728-textstore-220718.json'
 annotation_store_path = 'data/1728-annotationstore-220718.json'
+# the only annotation fields that are used
+annotation_fields = ("id", "type", "begin_anchor", "end_anchor", "begin_char_offset", "end_char_offset", "metadata")
+
+# components to exclude, and the component that sets the sentence boundaries instead of the excluded parser;
+# only lemma_, pos_ and the sentences are used, and the lemmatizer only depends on the tagger/morphologizer
+pipeline_profiles = {
+    "full": {"exclude": [], "sentences": None},
+    "senter": {"exclude": ["parser", "ner"], "sentences": "senter"},
+    "sentencizer": {"exclude": ["parser", "ner", "senter"], "sentences": "sentencizer"},
+}
+
+
+@dataclass
+class BuildJob:
+    title: str
+    text_store_path: str
+    annotation_store_path: str
+    output_dir: str
 
 
 @dataclass
@@ -19,129 +51,399 @@ class POSToken:
 
 
 @dataclass
-class Span:
-    tag: str
-    start_token_index: int
-    end_token_index: int
-    parameters: Dict[str, any] = field(default_factory=dict)
+class TaggedToken:
+    text: str
+    text_with_ws: str
+    idx: int
+    lemma: str
+    pos: str
 
 
-@dataclass
-class BlackLabInputDocument:
-    metadata: Dict[str, str] = field(default_factory=dict)
-    tokens: List[POSToken] = field(default_factory=list)
-    spans: List[Span] = field(default_factory=list)
-
-
-class ComplexHandler(json.JSONEncoder):
-    def default(self, o: Any) -> Any:
-        if isinstance(o, POSToken) or isinstance(o, BlackLabInputDocument) or isinstance(o, Span):
-            return o.__dict__
-        else:
-            return json.JSONEncoder.default(self, o)
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create the BlackLab input (CIF) with POS and lemma for the text store")
+    parser.add_argument("--chunk-by", choices=["none", "resolution", "republic_paragraph"], default="none",
+                        help="split the text at the boundaries of these annotations and tag the chunks with nlp.pipe"
+                             " (default: tag the whole text as one document)")
+    parser.add_argument("--batch-size", type=int, default=64, help="number of chunks per nlp.pipe batch")
+    parser.add_argument("--n-process", type=int, default=1, help="number of processes for nlp.pipe")
+    parser.add_argument("--model", default=spacy_core, help=f"the spaCy model to use (default: {spacy_core})")
+    parser.add_argument("--profile", choices=pipeline_profiles.keys(), default="full",
+                        help="which pipeline components to run: full, senter (no parser/ner, statistical sentence"
+                             " segmenter) or sentencizer (no parser/ner, rule-based sentence segmenter)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="COMPONENT",
+                        help="exclude this pipeline component as well (can be repeated)")
+    parser.add_argument("--tagging-cache", metavar="PATH",
+                        help="keep the tagging results per chunk in this sqlite database, and only tag the chunks"
+                             " that are not in it yet (needs --chunk-by)")
+    parser.add_argument("--store", nargs=2, action="append", metavar=("TEXT_STORE", "ANNOTATION_STORE"),
+                        help="build the corpus input for this text and annotation store (can be repeated; default:"
+                             f" {text_store_path} {annotation_store_path})")
+    parser.add_argument("--output-dir", default="out",
+                        help="where to write the output; with more than one store, every store gets a subdirectory"
+                             " named after its title (default: out)")
+    parser.add_argument("--split-by", choices=["none", *span_builders], default="none",
+                        help="write a CIF document per annotation of this type (e.g. session) instead of one"
+                             " document per store")
+    parser.add_argument("--jobs", type=int, default=1, help="number of stores to build in parallel")
+    args = parser.parse_args()
+    if args.tagging_cache and args.chunk_by == "none":
+        parser.error("--tagging-cache needs --chunk-by resolution or republic_paragraph")
+    return args
 
 
 @logger.catch
 def main():
-    nlp = spacy.load(spacy_core)
+    args = parse_args()
+    jobs = build_jobs(args.store or [(text_store_path, annotation_store_path)], args.output_dir)
+    if len(jobs) == 1:
+        results = [run_job(jobs[0], args)]
+    else:
+        logger.info(f"building {len(jobs)} stores, {args.jobs} at a time ...")
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            results = list(executor.map(run_job, jobs, [args] * len(jobs)))
+    write_manifest(os.path.join(args.output_dir, "manifest.json"), results)
+    failed = [r["title"] for r in results if r["status"] != "done"]
+    if failed:
+        logger.error(f"{len(failed)} of {len(results)} builds failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+def build_jobs(stores: List[Tuple[str, str]], output_dir: str) -> List[BuildJob]:
+    jobs = []
+    for text_store, annotation_store in stores:
+        title = store_title(text_store)
+        job_output_dir = output_dir if len(stores) == 1 else os.path.join(output_dir, title)
+        jobs.append(BuildJob(title, text_store, annotation_store, job_output_dir))
+    titles = [job.title for job in jobs]
+    duplicates = sorted({t for t in titles if titles.count(t) > 1})
+    if duplicates:
+        raise ValueError(f"more than one text store for {', '.join(duplicates)}")
+    return jobs
+
+
+def store_title(text_store: str) -> str:
+    """republic-1728 for data/1728-textstore-220718.json"""
+    return f"republic-{os.path.basename(text_store).split('-')[0]}"
+
+
+def run_job(job: BuildJob, args) -> Dict[str, Any]:
+    """Build one store, and return its manifest entry; a failed build is logged and reported, not raised."""
+    start = time.perf_counter()
+    result = {**asdict(job), "status": "done"}
+    try:
+        os.makedirs(job.output_dir, exist_ok=True)
+        result.update(build(job, args))
+    except Exception as e:
+        logger.exception(f"building {job.title} failed")
+        result.update(status="failed", error=f"{type(e).__name__}: {e}")
+    result["seconds"] = round(time.perf_counter() - start, 1)
+    return result
+
+
+def write_manifest(path: str, results: List[Dict[str, Any]]):
+    with open(path, "w") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "jobs": results}, f, indent=4)
+    logger.info(f"manifest written to {path}")
+
+
+_pipelines = {}
+
 
-    annotations, line_ids = load_annotations()
+def pipeline(args):
+    """The pipeline for the model/profile/exclude arguments, loaded once per process."""
+    key = (args.model, args.profile, tuple(args.exclude))
+    if key not in _pipelines:
+        _pipelines[key] = load_pipeline(args.model, args.profile, args.exclude)
+    return _pipelines[key]
+
+
+def build(job: BuildJob, args) -> Dict[str, Any]:
+    # the annotation store is parsed in a separate process, while the text store is read and the model is loaded
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        annotations_future = executor.submit(load_annotations, job.annotation_store_path)
+        lines = load_text_lines(job.text_store_path)
+        nlp = pipeline(args)
+        annotations_by_type, line_ids = annotations_future.result()
 
-    lines = load_text_lines()
     fixed_lines = [l.replace("\n", " ") for l in lines]
 
     selection = fixed_lines  # [0:1000]
     # ic(selection)
     line_idx_for_ending_offset = index_line_ending_offset(selection)
-
-    doc = calculate_pos(nlp, selection)
-
-    input_doc = init_input_doc()
-
+    anchor_index = AnchorIndex.for_lines(selection)
+
+    if args.chunk_by == "none":
+        tagged_sentences = calculate_pos(nlp, selection)
+    else:
+        chunk_starts = chunk_start_lines(annotations_by_type[args.chunk_by])
+        cache = TaggingCache(args.tagging_cache) if args.tagging_cache else None
+        tagged_sentences = calculate_pos_in_chunks(nlp, selection, chunk_starts, batch_size=args.batch_size,
+                                                   n_process=args.n_process, cache=cache)
+
+    metadata = input_doc_metadata(job)
+    spans = SpanTable()
+    token_store_path = os.path.join(job.output_dir, "out.tokens")
+    # the tokens are written while they are produced, the spans are written at the end
+    writers = [JsonDocumentWriter(os.path.join(job.output_dir, "out.json"), metadata),
+               TokenStoreWriter(token_store_path, metadata)]
+    if args.split_by == "none":
+        writers.insert(0, CifWriter(os.path.join(job.output_dir, "input.cif"), metadata))
+
+    tagging_start = time.perf_counter()
+    token_index = add_tokens(tagged_sentences, writers, spans, anchor_index, line_idx_for_ending_offset, line_ids)
+    log_tagging_performance(token_index, time.perf_counter() - tagging_start)
+
+    add_annotation_spans(spans, annotations_by_type, anchor_index)
+    for writer in writers:
+        writer.finish(spans)
+        writer.close()
+
+    result = {"tokens": token_index, "spans": len(spans)}
+    if args.split_by == "none":
+        result["documents"] = [{"file": "input.cif", "start_token": 0, "end_token": token_index}]
+    else:
+        with TokenStore(token_store_path) as store:
+            result["documents"] = write_cif_documents(store, spans, span_builders[args.split_by][0],
+                                                      os.path.join(job.output_dir, "cif"), metadata)
+    return result
+
+
+def write_cif_documents(store: TokenStore, spans: SpanTable, unit_tag: str, directory: str,
+                        metadata: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Write a CIF document per unit_tag span, with the metadata of the store and of the unit."""
+    os.makedirs(directory, exist_ok=True)
+    documents = unit_documents(spans, unit_tag, len(store))
+    document_spans = split_spans(spans, [start for start, _, _ in documents])
+    logger.info(f"writing {len(documents):,} {unit_tag} documents to {directory} ...")
+    entries = []
+    for (start, end, unit_parameters), unit_spans in zip(documents, document_spans):
+        document_id = unit_parameters.get("id", f"{metadata['title']}-front")
+        document_metadata = {**metadata, "title": document_id, "collection": metadata["title"],
+                             **{k: cif_value(v) for k, v in unit_parameters.items() if k != "id"}}
+        file_name = f"{document_id.replace(os.sep, '_')}.cif"
+        with CifWriter(os.path.join(directory, file_name), document_metadata, verbose=False) as writer:
+            for word, lemma, pos in zip(store.words[start:end], store.lemmas[start:end], store.pos[start:end]):
+                writer.add_token(word, lemma, pos)
+            writer.finish(unit_spans)
+        entries.append({"id": document_id, "file": os.path.join("cif", file_name), "start_token": start,
+                        "end_token": end})
+    return entries
+
+
+def add_tokens(tagged_sentences: Iterable[List[TaggedToken]], writers, spans: SpanTable, anchor_index: AnchorIndex,
+               line_idx_for_ending_offset: Dict[int, int], line_ids: Dict[int, str]) -> int:
+    """Add the word tokens to the writers and the anchor index, and the line and sentence spans to spans.
+
+    Returns the number of tokens.
+    """
     token_index = 0
     line_start = token_index
-    anchor_number = 0
-    token_spans_per_anchor = {}
+    recent_words = deque(maxlen=3)
     # page_start = token_index
-    for sentence in doc.sents:
+    for sentence in tagged_sentences:
         sentence_start = token_index
         for token in sentence:
             word = token.text.strip().strip('#')
             if word:
-                pos_token = to_pos_token(input_doc, token, word)
-                input_doc.tokens.append(pos_token)
+                pos_token = to_pos_token(recent_words, token, word)
+                for writer in writers:
+                    writer.add_token(pos_token.word, pos_token.lemma, pos_token.pos)
+                anchor_index.add_token(token.idx, token.idx + len(token.text))
+                recent_words.append(word)
                 token_index += 1
 
             token_end_offset = token.idx + len(token.text_with_ws)
             token_is_last_of_line = token_end_offset in line_idx_for_ending_offset
             if token_is_last_of_line:  # last token of line
-                line = " ".join([t.word for t in input_doc.tokens[line_start:token_index]])
                 line_idx = line_idx_for_ending_offset[token_end_offset]
-                input_doc.spans.append(
-                    Span("l", line_start, token_index,
-                         parameters={
-                             "id": line_ids[line_idx],
-                             # "line_idx": line_idx,
-                             # "anchor_number": anchor_number,
-                             # "text": line
-                         }))
-
-                # ic(line)
-                # x = f"{line_ids[line_idx]} {line}"
-                # ic(x)
-                token_spans_per_anchor[anchor_number] = (line_start, token_index)
-                anchor_number += 1
+                spans.add("l", line_start, token_index,
+                          parameters={
+                              "id": line_ids[line_idx],
+                              # "line_idx": line_idx,
+                              # "anchor_number": anchor_number,
+                          })
                 line_start = token_index
 
                 # if token.text_with_ws == "\n":  # page ends
-                #     input_doc.spans.append(Span("p", page_start, token_index - 1))
+                #     spans.add("p", page_start, token_index - 1)
                 #     page_start = token_index
 
-        add_sentence_span(input_doc, sentence_start, token_index)
-
-    add_annotation_spans(input_doc, annotations, token_spans_per_anchor)
-    # ic(input_doc)
-    export(input_doc, "out/input.cif")
-    export_json(input_doc)
+        add_sentence_span(spans, sentence_start, token_index)
+    return token_index
 
 
-def init_input_doc():
-    input_doc = BlackLabInputDocument()
-    input_doc.metadata["title"] = "republic-1728"
-    input_doc.metadata["text_source"] = text_store_path
-    input_doc.metadata["annotation_source"] = annotation_store_path
-    return input_doc
+def load_pipeline(model: str, profile: str, exclude: List[str]):
+    start = time.perf_counter()
+    settings = pipeline_profiles[profile]
+    nlp = spacy.load(model, exclude=settings["exclude"] + exclude)
+    sentences = settings["sentences"]
+    if sentences == "senter" and "senter" in nlp.disabled:
+        nlp.enable_pipe("senter")
+    elif sentences and not (nlp.has_pipe("senter") or nlp.has_pipe("sentencizer")):
+        logger.info(f"{model} has no {sentences}, using the rule-based sentencizer")
+        nlp.add_pipe("sentencizer")
+    logger.info(f"loaded {model} with profile {profile}: {', '.join(nlp.pipe_names)}"
+                f" in {time.perf_counter() - start:.1f}s, peak RSS {peak_rss_mb():,.0f} MB")
+    return nlp
 
 
-def add_annotation_spans(input_doc, annotations, token_spans_per_anchor):
-    add_spans(annotations=annotations, input_doc=input_doc, token_spans_per_anchor=token_spans_per_anchor,
-              annotation_type="attendant", span_tag="attendant", parameter_func=lambda a: a["metadata"])
+def log_tagging_performance(number_of_tokens: int, seconds: float):
+    logger.info(f"tagged {number_of_tokens:,} tokens in {seconds:.1f}s"
+                f" ({number_of_tokens / seconds if seconds else 0:,.0f} tokens/s),"
+                f" peak RSS {peak_rss_mb():,.0f} MB (child processes: {peak_rss_mb(resource.RUSAGE_CHILDREN):,.0f} MB)")
 
-    add_spans(annotations=annotations, input_doc=input_doc, token_spans_per_anchor=token_spans_per_anchor,
-              annotation_type="session", span_tag="session", parameter_func=session_parameters)
 
-    add_spans(annotations=annotations, input_doc=input_doc, token_spans_per_anchor=token_spans_per_anchor,
-              annotation_type="republic_paragraph", span_tag="paragraph", parameter_func=paragraph_parameters)
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    max_rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in kilobytes elsewhere
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
 
-    add_spans(annotations=annotations, input_doc=input_doc, token_spans_per_anchor=token_spans_per_anchor,
-              annotation_type="attendance_list", span_tag="attendance_list", parameter_func=attendance_list_parameters)
 
-    add_spans(annotations=annotations, input_doc=input_doc, token_spans_per_anchor=token_spans_per_anchor,
-              annotation_type="page", span_tag="page", parameter_func=lambda a: {"scan_id": a["metadata"]["scan_id"]})
+def input_doc_metadata(job: BuildJob) -> Dict[str, str]:
+    return {
+        "title": job.title,
+        "text_source": job.text_store_path,
+        "annotation_source": job.annotation_store_path
+    }
 
-    add_spans(annotations=annotations, input_doc=input_doc, token_spans_per_anchor=token_spans_per_anchor,
-              annotation_type="resolution", span_tag="resolution", parameter_func=resolution_parameters)
 
-    add_spans(annotations=annotations, input_doc=input_doc, token_spans_per_anchor=token_spans_per_anchor,
-              annotation_type="reviewed", span_tag="reviewed", parameter_func=reviewed_parameters)
+def add_annotation_spans(spans, annotations_by_type, anchor_index: AnchorIndex):
+    report = ResolutionReport()
+    for annotation_type, (span_tag, parameter_func) in span_builders.items():
+        add_spans(annotations=annotations_by_type[annotation_type], spans=spans, anchor_index=anchor_index,
+                  annotation_type=annotation_type, span_tag=span_tag, parameter_func=parameter_func, report=report)
+    report.log()
 
 
-def calculate_pos(nlp, selection):
+def calculate_pos(nlp, selection) -> Iterator[List[TaggedToken]]:
     text = ' '.join(selection)
     nlp.max_length = len(text)
     logger.info(f"spacy: processing {nlp.max_length:,} chars ...")
     doc = nlp(text)
-    return doc
+    for sentence in doc.sents:
+        yield [to_tagged_token(token, 0) for token in sentence]
+
+
+def chunk_start_lines(annotations) -> Set[int]:
+    chunk_starts = set()
+    for a in annotations:
+        chunk_starts.add(a["begin_anchor"])
+        chunk_starts.add(a["end_anchor"] + 1)
+    return chunk_starts
+
+
+def calculate_pos_in_chunks(nlp, selection, chunk_starts: Set[int], batch_size: int, n_process: int,
+                            cache: TaggingCache = None) -> Iterator[List[TaggedToken]]:
+    """Tag the lines in chunks that start at the given line indexes, using nlp.pipe with batch_size and n_process.
+
+    The token offsets are shifted to offsets in the ' '-joined text of all lines, and the ' ' that joins two chunks
+    is added to the tokens the way spaCy would have tokenized it in the joined text, so the token stream is the
+    same as that of calculate_pos, as long as no sentence crosses a chunk boundary.
+
+    With a cache, only the chunks that are not in it are tagged; the cached tokens have chunk-relative offsets.
+    """
+    chunks = list(text_chunks(selection, chunk_starts))
+    if cache is not None:
+        fingerprint = pipeline_fingerprint(nlp)
+        keys = [chunk_key(fingerprint, text) for text, _ in chunks]
+        # only which chunks are cached is looked up now; a cached chunk is read when it is its turn
+        existing = cache.existing_keys(keys)
+        cached = [key in existing for key in keys]
+    else:
+        keys = [None] * len(chunks)
+        cached = [False] * len(chunks)
+    to_tag = [chunk for chunk, is_cached in zip(chunks, cached) if not is_cached]
+    if cache is not None:
+        logger.info(f"{len(chunks) - len(to_tag):,} of {len(chunks):,} chunks found in {cache.path}")
+    if to_tag:
+        nlp.max_length = max(nlp.max_length, max(len(text) for text, _ in to_tag))
+    logger.info(f"spacy: processing {sum(len(text) for text, _ in to_tag):,} chars in {len(to_tag):,} chunks"
+                f" (batch_size={batch_size}, n_process={n_process}) ...")
+    last_chunk_idx = len(chunks) - 1
+    # nlp.pipe keeps the order, so the next doc is always that of the next chunk that is not cached
+    docs = nlp.pipe(to_tag, as_tuples=True, batch_size=batch_size, n_process=n_process)
+
+    def chunk_sentences() -> Iterator[Tuple[List[List[TaggedToken]], Optional[int]]]:
+        for chunk_idx, ((text, offset), key, is_cached) in enumerate(zip(chunks, keys, cached)):
+            if not is_cached:
+                doc, _ = next(docs)
+                sentences = [[to_tagged_token(token, offset) for token in sentence] for sentence in doc.sents]
+                if cache is not None:
+                    cache.put(key, [[[t.text, t.text_with_ws, t.idx - offset, t.lemma, t.pos] for t in sentence]
+                                    for sentence in sentences])
+            else:
+                sentences = [[TaggedToken(token_text, text_with_ws, idx + offset, lemma, pos)
+                              for token_text, text_with_ws, idx, lemma, pos in sentence]
+                             for sentence in cache.get(key)]
+            yield sentences, offset + len(text) if chunk_idx < last_chunk_idx else None
+
+    yield from join_chunks(chunk_sentences())
+    if cache is not None:
+        logger.info(f"tagging cache: {cache.stats.hits:,} hits, {cache.stats.misses:,} misses")
+        cache.close()
+
+
+def join_chunks(chunk_sentences: Iterable[Tuple[List[List[TaggedToken]], Optional[int]]]) \
+        -> Iterator[List[TaggedToken]]:
+    """Join the sentences of the chunks into the sentences of the ' '-joined text.
+
+    chunk_sentences gives the sentences of every chunk with the offset of the ' ' that joins it to the next chunk
+    (None for the last chunk). That ' ' and the whitespace around it are tokenized the way spaCy tokenizes the
+    joined text: the first whitespace after a word is its trailing whitespace, the rest of the run is one SPACE
+    token. So the last sentence is held back until the first token of the next chunk is known.
+    """
+    held = None
+    at_separator = False
+    for sentences, chunk_end in chunk_sentences:
+        for sentence in sentences:
+            if at_separator and held is not None and held[-1].text.isspace() and sentence[0].text.isspace():
+                # the separator and the leading whitespace of this chunk are one whitespace run
+                held[-1].text += sentence[0].text
+                held[-1].text_with_ws += sentence[0].text_with_ws
+                sentence = sentence[1:]
+            at_separator = False
+            if not sentence:
+                continue
+            if held is not None:
+                yield held
+            held = sentence
+        if chunk_end is not None:
+            if held is None:
+                held = [TaggedToken(text=' ', text_with_ws=' ', idx=chunk_end, lemma=' ', pos='SPACE')]
+            else:
+                add_chunk_separator(held, chunk_end)
+            at_separator = True
+    if held is not None:
+        yield held
+
+
+def text_chunks(lines, chunk_starts: Set[int]) -> Iterator[tuple]:
+    """Yield (text, offset) for the ' '-joined runs of lines, split before every line index in chunk_starts."""
+    offset = 0
+    chunk = []
+    for i, line in enumerate(lines):
+        if i in chunk_starts and chunk:
+            text = ' '.join(chunk)
+            yield text, offset
+            offset += len(text) + 1
+            chunk = []
+        chunk.append(line)
+    yield ' '.join(chunk), offset
+
+
+def add_chunk_separator(sentence: List[TaggedToken], chunk_end: int):
+    last_token = sentence[-1]
+    if last_token.text_with_ws == last_token.text or last_token.text.isspace():
+        last_token.text_with_ws += ' '
+        if last_token.text.isspace():
+            last_token.text += ' '
+    else:
+        sentence.append(TaggedToken(text=' ', text_with_ws=' ', idx=chunk_end, lemma=' ', pos='SPACE'))
+
+
+def to_tagged_token(token, offset: int) -> TaggedToken:
+    return TaggedToken(text=token.text, text_with_ws=token.text_with_ws, idx=token.idx + offset,
+                       lemma=token.lemma_, pos=token.pos_)
 
 
 def index_line_ending_offset(lines):
@@ -157,92 +459,59 @@ def index_line_ending_offset(lines):
     return line_idx_for_ending_offset
 
 
-def load_text_lines():
+def load_text_lines(text_store_path: str):
     logger.info(f"reading {text_store_path} ...")
-    with open(text_store_path) as f:
-        text_store = json.load(f)
-        lines = text_store['_resources'][0]['_ordered_segments']
+    lines = list(iter_json_file_array_items(text_store_path, ["_resources", 0, "_ordered_segments"]))
     logger.info(f" {len(lines):,} lines read.")
     return lines
 
 
-def load_annotations():
+def load_annotations(annotation_store_path: str):
     logger.info(f"reading {annotation_store_path} ...")
-    with open(annotation_store_path) as f:
-        annotations = json.load(f)
-    logger.info(f" {len(annotations):,} annotations read.")
-    line_annotations = [a for a in annotations if a["type"] == "line"]
-    line_ids = {}
-    for la in line_annotations:
-        line_idx = la["begin_anchor"]
-        line_id = la["id"]
-        line_ids[line_idx] = line_id
-    return annotations, line_ids
+    annotations = (slim_annotation(a) for a in iter_json_file_array_items(annotation_store_path))
+    return index_annotations(annotations, span_builders.keys())
 
 
-def export_json(input_doc):
-    path = 'out/out.json'
-    logger.info(f"writing to {path}")
-    with open(path, "w") as f:
-        json.dump(obj=input_doc, fp=f, indent=4, cls=ComplexHandler)
+def slim_annotation(annotation: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: annotation[k] for k in annotation_fields if k in annotation}
 
 
-def export(input_doc, path):
-    logger.info(f"exporting to {path} ...")
-    with open(path, "w") as f:
-        f.write("DOC_START\n")
-        for k, v in input_doc.metadata.items():
-            f.write(f"  METADATA {k} {v}\n")
-        f.write("  FIELD_START contents\n")
-
-        number_of_tokens = len(input_doc.tokens)
-        for i, token in enumerate(input_doc.tokens):
-            f.write(f"    VAL word {token.word}\n")
-            f.write(f"    VAL lemma {token.lemma}\n")
-            f.write(f"    VAL pos {token.pos}\n")
-            if i < number_of_tokens - 1:
-                f.write("    ADVANCE 1\n")
-
-        for span in input_doc.spans:
-            f.write(f"    SPAN {span.tag} {span.start_token_index} {span.end_token_index}")
-            for k, v in span.parameters.items():
-                if isinstance(v, str):
-                    value = v.replace(" ", "_").replace("#", "_")
-                else:
-                    value = v
-                if value != "":
-                    f.write(f" {k} {value}")
-            f.write("\n")
-
-        f.write("  FIELD_END\n")
-        f.write("DOC_END\n")
+def index_annotations(annotations: Iterable[Dict[str, Any]],
+                      annotation_types: Iterable[str]) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[int, str]]:
+    """In one pass, group the annotations of the given types by type, and collect the line ids per line index.
+
+    Annotations of other types are dropped, so the annotations can be streamed in.
+    """
+    annotations_by_type = {t: [] for t in annotation_types}
+    line_ids = {}
+    number_of_annotations = 0
+    for a in annotations:
+        number_of_annotations += 1
+        annotation_type = a["type"]
+        if annotation_type == "line":
+            line_ids[a["begin_anchor"]] = a["id"]
+        elif annotation_type in annotations_by_type:
+            annotations_by_type[annotation_type].append(a)
+    logger.info(f" {number_of_annotations:,} annotations read.")
+    for annotation_type, relevant_annotations in annotations_by_type.items():
+        logger.info(f"{len(relevant_annotations):,} {annotation_type} annotations found")
+    return annotations_by_type, line_ids
 
 
 def add_newline(l: str) -> str:
     return l if l.endswith("\n") else f"{l}\n"
 
 
-def add_spans(annotations, input_doc, token_spans_per_anchor, annotation_type, span_tag, parameter_func):
-    relevant_annotations = [a for a in annotations if a["type"] == annotation_type]
-    logger.info(f"{len(relevant_annotations):,} {annotation_type} annotations found")
-    for annotation in relevant_annotations:
-        annotation_id = annotation["id"]
-        begin_anchor = annotation["begin_anchor"]
-        end_anchor = annotation["end_anchor"]
-        if begin_anchor in token_spans_per_anchor and end_anchor in token_spans_per_anchor:
-            start_token = token_spans_per_anchor[begin_anchor][0]
-            end_token = token_spans_per_anchor[end_anchor][1]
+def add_spans(annotations, spans, anchor_index: AnchorIndex, annotation_type, span_tag, parameter_func,
+              report: ResolutionReport):
+    logger.info(f"adding {len(annotations):,} {annotation_type} annotations as {span_tag} spans")
+    for annotation in annotations:
+        token_range = anchor_index.resolve(annotation)
+        report.add(span_tag, annotation, token_range)
+        if token_range:
             parameters = parameter_func(annotation)
-            parameters["id"] = annotation_id
-            input_doc.spans.append(
-                Span(span_tag, start_token, end_token, parameters=parameters))
-        else:
-            if begin_anchor not in token_spans_per_anchor:
-                logger.warning(f"begin_anchor {begin_anchor} not a key"
-                               f" in token_spans_per_anchor, no {span_tag} span added!")
-            if end_anchor not in token_spans_per_anchor:
-                logger.warning(f"end_anchor {end_anchor} not a key"
-                               f" in token_spans_per_anchor, no {span_tag} span added!")
+            parameters["id"] = annotation["id"]
+            spans.add(span_tag, *token_range, parameters=parameters)
 
 
 def session_parameters(annotation: Dict[str, Any]) -> Dict[str, Any]:
@@ -283,23 +552,33 @@ def paragraph_parameters(annotation: Dict[str, Any]) -> Dict[str, Any]:
     return parameters
 
 
-def add_sentence_span(input_doc, sentence_start, token_index):
+# annotation type -> (span tag, parameter function), in the order in which the spans are added
+span_builders = {
+    "attendant": ("attendant", lambda a: a["metadata"]),
+    "session": ("session", session_parameters),
+    "republic_paragraph": ("paragraph", paragraph_parameters),
+    "attendance_list": ("attendance_list", attendance_list_parameters),
+    "page": ("page", lambda a: {"scan_id": a["metadata"]["scan_id"]}),
+    "resolution": ("resolution", resolution_parameters),
+    "reviewed": ("reviewed", reviewed_parameters),
+}
+
+
+def add_sentence_span(spans, sentence_start, token_index):
     sentence_end = token_index
     if sentence_end > sentence_start:
-        input_doc.spans.append(Span("s", sentence_start, sentence_end))
-        # sent = " ".join([t.word for t in input_doc.tokens[sentence_start:sentence_end]])
-        # ic(sent)
+        spans.add("s", sentence_start, sentence_end)
 
 
-def to_pos_token(input_doc, token, word):
-    lemma = token.lemma_.strip()
+def to_pos_token(recent_words, token, word):
+    lemma = token.lemma.strip()
     if not lemma:
         logger.warning(f"no lemma found for word '{word}', using '{word}'")
         lemma = word
-    pos = token.pos_
+    pos = token.pos
     if not pos:
         raise Exception(
-            f"lemma ({lemma}) or pos ({pos}) empty for word ({word}) after {input_doc.tokens[-3].word} {input_doc.tokens[-2].word} {input_doc.tokens[-1].word}")
+            f"lemma ({lemma}) or pos ({pos}) empty for word ({word}) after {' '.join(recent_words)}")
     pos_token = POSToken(word=word, lemma=lemma, pos=pos)
     return pos_token
 
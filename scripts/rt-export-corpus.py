@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+
+from republic_tools.blacklab_client import BlackLabClient
+from republic_tools.blacklab_export import export_corpus
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the metadata and contents of all documents of a BlackLab"
+                                                 " corpus to a JSONL file")
+    parser.add_argument("base_url", help="the BlackLab server, e.g. https://example.org/blacklab-server")
+    parser.add_argument("corpus", help="the corpus name")
+    parser.add_argument("output", help="the JSONL file; an existing export is continued, unless --restart is given")
+    parser.add_argument("--filter", help="only export the documents that match this metadata filter query")
+    parser.add_argument("--no-contents", action="store_true", help="only export the metadata")
+    parser.add_argument("--workers", type=int, default=8, help="number of documents to fetch at the same time")
+    parser.add_argument("--page-size", type=int, default=100, help="number of documents per page of the list")
+    parser.add_argument("--restart", action="store_true", help="overwrite the output instead of continuing it")
+    parser.add_argument("--timeout", type=int, default=60, help="request timeout in seconds")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with BlackLabClient(args.base_url, timeout=args.timeout, pool_maxsize=args.workers) as client:
+        stats = export_corpus(client, args.corpus, args.output, filter=args.filter, contents=not args.no_contents,
+                              max_workers=args.workers, page_size=args.page_size, resume=not args.restart)
+    if stats.failed:
+        sys.exit(f"{len(stats.failed)} documents failed, run again to retry them")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,166 @@
 #!/usr/bin/env python3
-import json
-from collections import defaultdict
+import argparse
+import heapq
+import os
+import sys
+from itertools import islice
+from typing import Iterator, Optional, Tuple, TextIO
+
+from republic_tools.blacklab_input import SpanTable
+from republic_tools.json_stream import iter_json_file_array_items
+from republic_tools.span_index import SpanIndex
+from republic_tools.token_store import TokenStore, is_token_store
+
+block_size = 10_000
+
+
+class TokenStoreInput:
+    def __init__(self, path: str):
+        self.store = TokenStore(path)
+        self.tags = self.store.span_tags
+        self.tag_ids = self.store.span_tag_ids
+        self.starts = self.store.span_starts
+        self.ends = self.store.span_ends
+        self.span_index = self.store.span_index()
+
+    def words(self, start: int, end: Optional[int]) -> Iterator[str]:
+        end = len(self.store) if end is None else min(end, len(self.store))
+        for block_start in range(start, end, block_size):
+            yield from self.store.words[block_start:min(end, block_start + block_size)]
+
+    def close(self):
+        self.tags = self.tag_ids = self.starts = self.ends = self.span_index = None
+        self.store.close()
+
+
+class JsonInput:
+    """The out.json of rt-create-pos; the tokens are streamed from the file, of the spans only the ids are kept."""
+
+    def __init__(self, path: str):
+        self.path = path
+        spans = SpanTable()
+        span_ids = []
+        for span in iter_json_file_array_items(path, ["spans"]):
+            spans.add(span["tag"], span["start_token_index"], span["end_token_index"])
+            span_ids.append(span["parameters"].get("id"))
+        self.tags = spans.tags
+        self.tag_ids = spans.tag_ids
+        self.starts = spans.starts
+        self.ends = spans.ends
+        self.span_index = SpanIndex.build(spans.tag_ids, spans.starts, spans.ends, span_ids)
+
+    def words(self, start: int, end: Optional[int]) -> Iterator[str]:
+        for token in islice(iter_json_file_array_items(self.path, ["tokens"]), start, end):
+            yield token["word"]
+
+    def close(self):
+        pass
+
+
+def open_input(path: str):
+    return TokenStoreInput(path) if is_token_store(path) else JsonInput(path)
+
+
+def find_span(source, span_id: str) -> Optional[Tuple[int, int]]:
+    j = source.span_index.find(span_id)
+    return None if j is None else (source.starts[j], source.ends[j])
+
+
+def tag_events(source, start: int, end: Optional[int]) -> Iterator[Tuple[int, int, str]]:
+    """(token index, kind, tag) of the closing (kind 0) and opening (kind 1) tags in the range, in token order.
+
+    The spans that overlap the range are clipped to it; without end, the range runs to the last token. The span
+    index gives the spans of every tag in order of start, and these runs are merged lazily for the opening tags.
+    The closing tag of a span goes on a heap when the span is opened, so only the open spans are in memory.
+    A closing tag at index i is printed after token i - 1.
+    """
+    if end is None:
+        end = sys.maxsize
+    tags, tag_ids, starts, ends = source.tags, source.tag_ids, source.starts, source.ends
+
+    def opening_events(spans: Iterator[int]) -> Iterator[tuple]:
+        for j in spans:
+            tag = tags[tag_ids[j]]
+            yield max(starts[j], start), 1, f"<{tag}>", (min(ends[j], end), 0, f"</{tag}>")
+
+    opening = heapq.merge(*(opening_events(spans) for spans in source.span_index.overlapping_by_tag(start, end)))
+    next_opening = next(opening, None)
+    closing = []
+    while next_opening is not None or closing:
+        index = min(next_opening[0] if next_opening is not None else sys.maxsize,
+                    closing[0][0] if closing else sys.maxsize)
+        # all spans that open at index are read first, since an empty one also closes there
+        opened = []
+        while next_opening is not None and next_opening[0] == index:
+            opened.append(next_opening[:3])
+            heapq.heappush(closing, next_opening[3])
+            next_opening = next(opening, None)
+        while closing and closing[0][0] == index:
+            yield heapq.heappop(closing)
+        yield from opened
+
+
+def render(source, start: int, end: Optional[int], out: TextIO):
+    events = tag_events(source, start, end)
+    event = next(events, None)
+    parts = []
+    for i, word in enumerate(source.words(start, end), start):
+        # closing tags that come before this token were printed after the previous one
+        while event is not None and (event[0] < i or (event[0] == i and event[1] == 0)):
+            event = next(events, None)
+        open_tags = []
+        while event is not None and event[0] == i:
+            open_tags.append(event[2])
+            event = next(events, None)
+        if open_tags:
+            if "<l>" in open_tags:
+                parts.append(f"{i:6d} | ")
+            parts.append("".join(open_tags))
+        parts.append(word)
+        close_tags = []
+        while event is not None and event[0] == i + 1 and event[1] == 0:
+            close_tags.append(event[2])
+            event = next(events, None)
+        if close_tags:
+            close_tags.reverse()
+            parts.append("".join(close_tags))
+            parts.append("\n" if "</l>" in close_tags else " ")
+        else:
+            parts.append(" ")
+        if len(parts) >= block_size:
+            out.write("".join(parts))
+            parts = []
+    parts.append("\n")
+    out.write("".join(parts))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Print the tokens of the BlackLab input with their spans as tags")
+    parser.add_argument("input", nargs="?",
+                        help="the token store or json written by rt-create-pos"
+                             " (default: out/out.tokens, or out/out.json if there is no token store)")
+    parser.add_argument("--start", type=int, default=0, help="index of the first token to print")
+    parser.add_argument("--end", type=int, help="index after the last token to print (default: the last token)")
+    parser.add_argument("--id", help="only print the tokens of the span with this id, e.g. a session or resolution")
+    return parser.parse_args()
 
 
 def main():
-    with open('out/out.json') as f:
-        data = json.load(f)
-    tokens = data["tokens"]
-    spans = data["spans"]
-    open_tags = defaultdict(lambda: [])
-    close_tags = defaultdict(lambda: [])
-    for s in spans:
-        open_tags[s["start_token_index"]].append(f"<{s['tag']}>")
-        close_tags[s["end_token_index"]].append(f"</{s['tag']}>")
-    for i, token in enumerate(tokens):
-        if i in open_tags:
-            tags = sorted(open_tags[i])
-            if "<l>" in tags:
-                print(f"{i:6d} | ", end="")
-            print("".join(tags), end="")
-        print(f"{token['word']}", end="")
-        if i + 1 in close_tags:
-            tags = sorted(close_tags[i + 1], reverse=True)
-            print("".join(tags), end="")
-            if "</l>" in tags:
-                print()
-            else:
-                print(" ", end="")
+    args = parse_args()
+    path = args.input or ('out/out.tokens' if os.path.exists('out/out.tokens') else 'out/out.json')
+    source = open_input(path)
+    try:
+        if args.id:
+            span_range = find_span(source, args.id)
+            if span_range is None:
+                sys.exit(f"no span with id {args.id} in {path}")
+            start, end = span_range
         else:
-            print(" ", end="")
-    print()
+            # without --end, the tokens are rendered until they run out
+            start, end = args.start, args.end
+        render(source, start, end, sys.stdout)
+    finally:
+        source.close()
 
 
 if __name__ == '__main__':
@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
+import argparse
 import base64
+import csv
 import json
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, TextIO
 
 from loguru import logger
 
@@ -28,34 +34,143 @@ facet_names = {
     "ORG": "organisationName"
 }
 
+link_fields = ["id", "category", "name", "source", "entity_browser_url", "query", "tav_url"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate the entity browser and TAV search links of the entities")
+    parser.add_argument("paths", nargs="*", default=paths, metavar="ENTITY_FILE",
+                        help="the entity json files (default: the five entity files in ../republic-untangle/data)")
+    parser.add_argument("--format", choices=["text", "csv", "jsonl", "lookup"], default="text",
+                        help="text: the links per entity, as before; csv/jsonl: a row per entity;"
+                             " lookup: one json object with the links keyed by entity id (default: text)")
+    parser.add_argument("--output", help="write the links to this file (default: stdout)")
+    parser.add_argument("--jobs", type=int, default=4, help="number of entity files to load in parallel")
+    parser.add_argument("--duplicates", help="write the names that occur more than once to this csv file")
+    parser.add_argument("--duplicate-ids", help="write the ids that occur more than once to this csv file")
+    return parser.parse_args()
+
 
 def main():
-    global b64
-    for path in paths:
-        print(f"<= {path}")
-        with open(path) as f:
-            entities = json.load(f)
-        name_values = set()
-        for e in entities:
-            e_category = e["category"]
-            e_id = e['id']
-            eb_endpoint = entity_browser_names[e_category]
-            eb_url = f"https://entiteiten.goetgevonden.nl/{eb_endpoint}/{e_id}"
-            print(eb_url)
-            facet_name = facet_names[e_category]
-            e_name = e["name"]
-            if e_name in name_values:
-                logger.error(f"duplicate name {e_name} for {e_category}")
-            name_values.add(e_name)
-            query = '{"terms":{"' + facet_name + '":["' + e_name + '"]}}'
-            # ic(query)
-            print(f"query={query}")
-            b64 = base64.b64encode(bytes(query, 'utf-8')).decode('utf-8')
-            tav_url = f"https://app.goetgevonden.nl?query={b64}"
-            print(tav_url)
-            print()
-        print()
+    args = parse_args()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.jobs, len(args.paths)))) as executor:
+        entities_per_path = list(executor.map(load_entities, args.paths))
+    links = [entity_links(e, path) for path, entities in zip(args.paths, entities_per_path) for e in entities]
+    logger.info(f"{len(links):,} entities loaded from {len(args.paths)} files")
+
+    duplicates = find_duplicates(links, "name")
+    report_duplicates(duplicates)
+    if args.duplicates:
+        write_duplicates(args.duplicates, duplicates, "name")
+    duplicate_ids = find_duplicates(links, "id")
+    report_duplicate_ids(duplicate_ids, args.format)
+    if args.duplicate_ids:
+        write_duplicates(args.duplicate_ids, duplicate_ids, "id")
+
+    out = open(args.output, "w", newline="", buffering=1 << 20) if args.output else sys.stdout
+    try:
+        writers[args.format](links, args.paths, out)
+    finally:
+        if args.output:
+            out.close()
+            logger.info(f"{len(links):,} entity links written to {args.output}")
+
+
+def load_entities(path: str) -> List[Dict[str, str]]:
+    with open(path) as f:
+        entities = json.load(f)
+    # only these fields are sent back to the main process
+    return [{"id": e["id"], "category": e["category"], "name": e["name"]} for e in entities]
+
+
+def entity_links(entity: Dict[str, str], source: str) -> Dict[str, str]:
+    e_category = entity["category"]
+    e_id = entity["id"]
+    e_name = entity["name"]
+    query = json.dumps({"terms": {facet_names[e_category]: [e_name]}}, separators=(",", ":"), ensure_ascii=False)
+    b64 = base64.b64encode(query.encode("utf-8")).decode("utf-8")
+    return {
+        "id": e_id,
+        "category": e_category,
+        "name": e_name,
+        "source": source,
+        "entity_browser_url": f"https://entiteiten.goetgevonden.nl/{entity_browser_names[e_category]}/{e_id}",
+        "query": query,
+        "tav_url": f"https://app.goetgevonden.nl?query={b64}",
+    }
+
+
+def find_duplicates(links: List[Dict[str, str]], field: str) -> Dict[str, List[Dict[str, str]]]:
+    """The entities per value of field (name or id), for the values that occur more than once, in any file."""
+    entities_per_value = defaultdict(list)
+    for link in links:
+        entities_per_value[link[field]].append(link)
+    return {value: entities for value, entities in entities_per_value.items() if len(entities) > 1}
+
+
+def report_duplicates(duplicates: Dict[str, List[Dict[str, str]]]):
+    # a duplicate name within a category gives one TAV search for two entities
+    within_category = [name for name, entities in duplicates.items()
+                       if len({e["category"] for e in entities}) < len(entities)]
+    across_categories = [name for name, entities in duplicates.items()
+                         if len({e["category"] for e in entities}) > 1]
+    if within_category:
+        logger.error(f"{len(within_category):,} duplicate names within a category,"
+                     f" e.g. {', '.join(within_category[:5])}")
+    if across_categories:
+        logger.warning(f"{len(across_categories):,} names in more than one category,"
+                       f" e.g. {', '.join(across_categories[:5])}")
+
+
+def report_duplicate_ids(duplicate_ids: Dict[str, List[Dict[str, str]]], output_format: str):
+    if not duplicate_ids:
+        return
+    examples = ", ".join(f"{e_id} ({', '.join(sorted({e['source'] for e in entities}))})"
+                         for e_id, entities in list(duplicate_ids.items())[:5])
+    # the lookup is keyed by id, so of every duplicate id only the last entity is written
+    consequence = ", only the last entity of each is in the lookup" if output_format == "lookup" else ""
+    logger.error(f"{len(duplicate_ids):,} ids occur more than once{consequence}, e.g. {examples}")
+
+
+def write_duplicates(path: str, duplicates: Dict[str, List[Dict[str, str]]], field: str):
+    columns = [field] + [c for c in ["name", "id", "category", "source"] if c != field]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for entities in duplicates.values():
+            writer.writerows([e[c] for c in columns] for e in entities)
+    logger.info(f"{len(duplicates):,} duplicate {field}s written to {path}")
+
+
+def write_text(links: List[Dict[str, str]], sources: List[str], out: TextIO):
+    links_per_source = defaultdict(list)
+    for link in links:
+        links_per_source[link["source"]].append(link)
+    for source in sources:
+        parts = [f"<= {source}\n"]
+        for link in links_per_source[source]:
+            parts.append(f"{link['entity_browser_url']}\nquery={link['query']}\n{link['tav_url']}\n\n")
+        parts.append("\n")
+        out.write("".join(parts))
+
+
+def write_csv(links: List[Dict[str, str]], _, out: TextIO):
+    writer = csv.DictWriter(out, fieldnames=link_fields)
+    writer.writeheader()
+    writer.writerows(links)
+
+
+def write_jsonl(links: List[Dict[str, str]], _, out: TextIO):
+    out.write("".join(json.dumps(link, ensure_ascii=False) + "\n" for link in links))
+
+
+def write_lookup(links: List[Dict[str, str]], _, out: TextIO):
+    lookup = {link["id"]: {k: v for k, v in link.items() if k != "id"} for link in links}
+    json.dump(lookup, out, ensure_ascii=False)
+    out.write("\n")
+
 
+writers = {"text": write_text, "csv": write_csv, "jsonl": write_jsonl, "lookup": write_lookup}
 
 if __name__ == '__main__':
     main()
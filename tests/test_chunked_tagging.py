@@ -0,0 +1,53 @@
+import importlib.util
+import os
+
+import spacy
+
+from republic_tools.synthetic_stores import write_synthetic_stores
+
+
+def load_create_pos():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "rt-create-pos.py")
+    spec = importlib.util.spec_from_file_location("rt_create_pos", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+rt = load_create_pos()
+
+
+def blank_pipeline():
+    nlp = spacy.blank("nl")
+    nlp.add_pipe("sentencizer")
+    return nlp
+
+
+def token_stream(tagged_sentences):
+    return [(t.text, t.text_with_ws, t.idx) for sentence in tagged_sentences for t in sentence]
+
+
+def test_whitespace_at_chunk_boundary():
+    nlp = blank_pipeline()
+    lines = ["een twee ", "", "drie vier"]
+    assert (token_stream(rt.calculate_pos_in_chunks(nlp, lines, {1}, batch_size=8, n_process=1))
+            == token_stream(rt.calculate_pos(nlp, lines)))
+
+
+def test_chunked_tokens_and_lines_are_those_of_one_run(tmp_path):
+    text_store_path = str(tmp_path / "textstore.json")
+    annotation_store_path = str(tmp_path / "annotationstore.json")
+    write_synthetic_stores(text_store_path, annotation_store_path, 3000, 7)
+    lines = [l.replace("\n", " ") for l in rt.load_text_lines(text_store_path)]
+    annotations_by_type, _ = rt.load_annotations(annotation_store_path)
+    nlp = blank_pipeline()
+    tokens = token_stream(rt.calculate_pos(nlp, lines))
+    line_ends = rt.index_line_ending_offset(lines)
+    for chunk_by in ("resolution", "republic_paragraph"):
+        chunk_starts = rt.chunk_start_lines(annotations_by_type[chunk_by])
+        chunked_tokens = token_stream(rt.calculate_pos_in_chunks(nlp, lines, chunk_starts, batch_size=64,
+                                                                 n_process=1))
+        assert chunked_tokens == tokens
+        # the l spans end at the tokens that end on a line end
+        assert ([i for i, (_, text_with_ws, idx) in enumerate(chunked_tokens) if idx + len(text_with_ws) in line_ends]
+                == [i for i, (_, text_with_ws, idx) in enumerate(tokens) if idx + len(text_with_ws) in line_ends])
@@ -0,0 +1,38 @@
+import multiprocessing
+import time
+
+from republic_tools.tagging_cache import TaggingCache
+
+chunks_per_writer = 100
+
+
+def write_chunks(path: str, writer: int):
+    # a short busy timeout: a writer that held the lock while tagging would make the other one fail
+    with TaggingCache(path, commit_every=40, timeout=0.5) as cache:
+        for i in range(chunks_per_writer):
+            key = f"{writer}-{i}"
+            if cache.get(key) is None:
+                time.sleep(0.02)  # tagging
+                cache.put(key, [[["word", "word ", i, "lemma", "NOUN"]]])
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / "tagging-cache.sqlite")
+    context = multiprocessing.get_context("spawn")
+    writers = [context.Process(target=write_chunks, args=(path, w)) for w in range(2)]
+    for p in writers:
+        p.start()
+    for p in writers:
+        p.join(timeout=120)
+    assert [p.exitcode for p in writers] == [0, 0]
+    with TaggingCache(path) as cache:
+        assert len(cache) == 2 * chunks_per_writer
+        assert cache.get("1-7") == [[["word", "word ", 7, "lemma", "NOUN"]]]
+
+
+def test_pending_entries_are_found(tmp_path):
+    with TaggingCache(str(tmp_path / "tagging-cache.sqlite"), commit_every=10) as cache:
+        cache.put("a", [1])
+        assert cache.get("a") == [1]
+        assert cache.get("b") is None
+        assert (cache.stats.hits, cache.stats.misses) == (1, 1)